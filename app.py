@@ -1,21 +1,34 @@
 import boto3
+from botocore.exceptions import BotoCoreError, ClientError
 import json
+import gzip
+import uuid
+import bisect
+import re
+import unicodedata
+from collections import OrderedDict, defaultdict, deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import hashlib
+import os
+import tempfile
+import numpy as np
 import pandas as pd
+import pyarrow as pa
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import altair as alt
 from st_keyup import st_keyup
 from streamlit_autorefresh import st_autorefresh
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
 from datetime import datetime
 import logging
+import threading
+import time
 import pytz
-from pandas.api.types import (
-    is_categorical_dtype,
-    is_datetime64_any_dtype,
-    is_numeric_dtype,
-    is_object_dtype,
-)
-import warnings
 
 # Set up logging
 logging.basicConfig(
@@ -25,8 +38,8 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Suppress specific warnings
-warnings.filterwarnings("ignore", category=UserWarning, message=".*Could not infer format.*")
+# Restaurant frames are shared by every session, so never let a session modify them in place
+pd.set_option('mode.copy_on_write', True)
 
 # Turn off logging for botocore
 logging.getLogger('botocore').setLevel(logging.CRITICAL)
@@ -39,84 +52,1070 @@ s3 = boto3.client(
     region_name=st.secrets["AWS_DEFAULT_REGION"]
 )
 
-# Define the bucket name and the file name
+# Define the bucket name and the file names
+# The data lives either in a single legacy JSON file (S3_JSON_NAME) or in a sharded layout:
+# a small manifest (S3_MANIFEST_NAME) listing every restaurant, plus one JSON object per restaurant
 bucket_name = st.secrets["S3_BUCKET_NAME"]
 json_file_name = st.secrets["S3_JSON_NAME"]
+manifest_file_name = st.secrets.get("S3_MANIFEST_NAME", "manifest.json")
+# 'auto' uses the manifest when there is one, 'sharded' requires it, and 'legacy' never looks for it
+S3_LAYOUT = st.secrets.get("S3_LAYOUT", "auto")
 flask_url = st.secrets["FLASK_APP_URL"]
 
-@st.cache_data(ttl=3600)
-def load_and_process_data(bucket_name, json_file_name, bypass_cache=False):
-    if bypass_cache:
-        st.cache_data.clear()
-
-    response = s3.get_object(Bucket=bucket_name, Key=json_file_name)
-    json_data = response['Body'].read().decode('utf-8')
-    data = json.loads(json_data)
-    reviews_df = {}
-    summary_dict = {}
-    ngrams_dict = {}
-    last_modified_dict = {}
-    for restaurant, restaurant_info in data.items():
-        reviews = restaurant_info['data']
-        df = pd.DataFrame(reviews)
-        df['DateOfReview'] = pd.to_datetime(df['DateOfReview'], format='%Y-%m-%d')
-        df = df.sort_values(by='DateOfReview', ascending=False)
-        df['StarRating'] = pd.to_numeric(df['StarRating'])
-        df['month_year'] = df['DateOfReview'].dt.to_period('M').dt.to_timestamp().dt.strftime('%b-%Y')
-        df['DateOfReview'] = df['DateOfReview'].dt.date
-        reviews_df[restaurant] = df.reset_index(drop=True)  
-
-        summary_dict[restaurant] = restaurant_info['summary']
-        ngrams_dict[restaurant] = restaurant_info['ngram']
-        last_modified_dict[restaurant] = restaurant_info['last_modified']
-
-        print('Restaurant info summary:')
-        print(restaurant_info['last_modified'])
-
-    logger.info('reviews_df reloaded')
-    return list(reviews_df.keys()), reviews_df, summary_dict, ngrams_dict, last_modified_dict
-
-def check_for_updates(bucket_name, json_file_name):
-    response = s3.head_object(Bucket=bucket_name, Key=json_file_name)
-    updated_time = response['LastModified']
-    
-    # Convert last_modified to Singapore time
-    updated_time = updated_time.astimezone(pytz.timezone('Asia/Singapore'))
+# Timeouts (in seconds) and retries of the calls to the Flask backend
+BACKEND_CONNECT_TIMEOUT = float(st.secrets.get("BACKEND_CONNECT_TIMEOUT", 3.05))
+BACKEND_READ_TIMEOUT = float(st.secrets.get("BACKEND_READ_TIMEOUT", 30))
+ANALYZE_READ_TIMEOUT = float(st.secrets.get("ANALYZE_READ_TIMEOUT", 600))  # The NLP model can take minutes
+BACKEND_RETRIES = int(st.secrets.get("BACKEND_RETRIES", 3))
+BACKEND_BACKOFF = 0.5  # Retries wait 0.5s, 1s, 2s, ...
+BACKEND_POOL_SIZE = 8
+ANALYZE_CHUNK_BYTES = 1_000_000  # Largest /analyze upload chunk, before compression
+STATUS_POLL_INTERVAL = 10  # Seconds between status polls of each outstanding scraping request, shared by all sessions
+STATUS_CHECK_INTERVAL = 2  # Seconds between checks of the shared status by a waiting session
+FINISHED_STATUS_TTL = 3600  # Seconds a completed or failed status is kept
 
-    logger.info(f'Live DB last modified date: {updated_time}')
-    return updated_time
+# Processed frames are kept on local disk, so a restart does not have to download and parse everything again
+snapshot_dir = st.secrets.get("SNAPSHOT_DIR", os.path.join(tempfile.gettempdir(), 'review-dashboard-snapshot'))
 
-def poll_status():
-    logger.info('Polling status')
-    if st.session_state.request_id:
-        status_url = f'{flask_url}/status/{st.session_state.request_id}'
-        response = requests.get(status_url)
-        status = response.json().get('status')
+UPDATE_CHECK_INTERVAL = 30  # Seconds between checks for new data in S3, shared by all sessions
+MANIFEST_PROBE_INTERVAL = 3600  # Seconds before looking again for a manifest, once the legacy file is in use
+NAME_SEARCH_MIN_OVERLAP = 0.5  # Fraction of the trigrams of a search that a name must share to be a fuzzy match
+NAME_SEARCH_FUZZY_LIMIT = 20  # Most fuzzy matches listed after the exact, prefix and substring matches
+NAME_SEARCH_NO_MATCH = 5
+FILTER_CACHE_SIZE = 256  # Filter results memoized per (dataset version, restaurant, filter state)
+S3_FETCH_WORKERS = 8  # Concurrent shard downloads when many restaurants are loaded at once
+REVIEW_PAGE_SIZES = (25, 50, 100, 200)  # Reviews per page of the review table
+REVIEW_PREVIEW_CHARS = 150  # Descriptions are cut to this length in the table, the full text is shown for the selected row
+# Sort orders of the review table, as (column, ascending). The frames are already newest first
+REVIEW_SORTS = {
+    'Newest first': ('DateOfReview', False),
+    'Oldest first': ('DateOfReview', True),
+    'Highest rating': ('StarRating', False),
+    'Lowest rating': ('StarRating', True),
+}
+CHART_CACHE_SIZE = 64  # Chart specs memoized per (dataset version, restaurant, include reviews with no description)
+COMPARE_MIN_REVIEWS = 10  # Default least number of reviews in the window for a restaurant to be ranked
+COMPARE_TREND_LIMIT = 5  # Restaurants plotted by default in the monthly trend of the comparison
+COMPARE_LOAD_BATCH = 50  # Restaurants read at once to build the comparison, their frames are dropped after each batch
+
+# Filters shown in the Filters expander, in order. 'kind' decides the widget and how the filter is applied
+FILTER_SCHEMA = {
+    'ReviewDescription': {'kind': 'text', 'label': 'Search reviews', 'placeholder': 'e.g. parking service, or "friendly staff" for a phrase'},
+    'StarRating': {'kind': 'range', 'label': 'Filter Star Rating', 'bounds': (1, 5)},
+    'month_year': {'kind': 'month_range'},
+}
+SNAPSHOT_INDEX_NAME = 'index.json'
+SNAPSHOT_METADATA_KEY = b'review_dashboard'
+SUMMARIZED_DIR_NAME = 'summarized'  # Hashes of the reviews already sent for summary, per restaurant
+
+# Observability. METRICS_PORT serves the metrics in the Prometheus text format on /metrics (0 to turn it off),
+# and DEBUG_PANEL shows the timings of each rerun in the sidebar: to everyone when it is true, only with
+# ?debug=1 in the URL when it is "url", and never otherwise (the default)
+METRICS_PORT = int(st.secrets.get("METRICS_PORT", 0))
+# A TOML boolean, or a string such as "true", "0" or "url" when the secret is set from the environment
+DEBUG_PANEL = str(st.secrets.get("DEBUG_PANEL", False)).strip().lower()
+if DEBUG_PANEL in ('1', 'true', 'yes', 'on'):
+    DEBUG_PANEL = 'on'
+elif DEBUG_PANEL != 'url':
+    DEBUG_PANEL = 'off'
+METRICS_PREFIX = 'review_dashboard_'
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+BYTES_BUCKETS = tuple(1024 * 4 ** i for i in range(10))  # 1 KiB to 256 MiB
+ACTIVE_SESSION_WINDOW = 600  # Seconds since its last rerun for a session to count as active
+RERUN_SPAN_LIMIT = 1000
+METRICS_HELP = {
+    'stage_seconds': ('histogram', 'Time spent in each stage: S3 GET, JSON parse, frame build, filtering, charts, backend HTTP, ...'),
+    'payload_bytes': ('histogram', 'Size of S3 downloads, /analyze uploads and review table pages'),
+    'cache_lookups_total': ('counter', 'Lookups of each in-memory cache'),
+    'cache_misses_total': ('counter', 'Lookups of each in-memory cache that had to build the value'),
+    's3_not_modified_total': ('counter', 'Conditional S3 GETs answered with 304 Not Modified'),
+    'backend_requests_total': ('counter', 'Requests to the Flask backend, by path and outcome'),
+    'reruns_total': ('counter', 'Script reruns'),
+    'active_sessions': ('gauge', f'Sessions that reran in the last {ACTIVE_SESSION_WINDOW} seconds'),
+}
+
+class Metrics:
+    """Process-wide counters and histograms, shared by every session and background thread."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)  # (name, labels) -> value
+        self._histograms = {}  # (name, labels) -> (buckets, bucket counts, sum, count)
+        self._sessions = OrderedDict()  # session id -> time of its last rerun, least recently seen first
+
+    def inc(self, name, value=1, **labels):
+        with self._lock:
+            self._counters[(name, tuple(sorted(labels.items())))] += value
+
+    def observe(self, name, value, buckets, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            buckets, counts, total, count = self._histograms.get(key, (buckets, [0] * len(buckets), 0.0, 0))
+            counts = [c + (value <= bound) for c, bound in zip(counts, buckets)]
+            self._histograms[key] = (buckets, counts, total + value, count + 1)
+
+    def session_seen(self, session_id):
+        with self._lock:
+            now = time.monotonic()
+            self._sessions[session_id] = now
+            self._sessions.move_to_end(session_id)
+            self._prune_sessions(now)
+
+    def _prune_sessions(self, now):
+        # Sessions are kept in the order they were last seen, so the stale ones are all at the front
+        while self._sessions and now - next(iter(self._sessions.values())) >= ACTIVE_SESSION_WINDOW:
+            self._sessions.popitem(last=False)
+
+    def render(self):
+        """Return the metrics in the Prometheus text exposition format."""
+        def series(name, labels, extra=()):
+            pairs = ','.join(f'{key}="{value}"' for key, value in (*labels, *extra))
+            return f'{METRICS_PREFIX}{name}{{{pairs}}}' if pairs else f'{METRICS_PREFIX}{name}'
+
+        with self._lock:
+            self._prune_sessions(time.monotonic())
+            samples = defaultdict(list)
+            for (name, labels), value in sorted(self._counters.items()):
+                samples[name].append(f'{series(name, labels)} {value:g}')
+            for (name, labels), (buckets, counts, total, count) in sorted(self._histograms.items()):
+                for bound, bucket_count in zip(buckets, counts):
+                    samples[name].append(f'{series(name + "_bucket", labels, [("le", f"{bound:g}")])} {bucket_count}')
+                samples[name].append(f'{series(name + "_bucket", labels, [("le", "+Inf")])} {count}')
+                samples[name].append(f'{series(name + "_sum", labels)} {total:g}')
+                samples[name].append(f'{series(name + "_count", labels)} {count}')
+            samples['active_sessions'].append(f'{series("active_sessions", ())} {len(self._sessions)}')
+
+        lines = []
+        for name, name_samples in samples.items():
+            kind, help_text = METRICS_HELP[name]
+            lines += [f'# HELP {METRICS_PREFIX}{name} {help_text}', f'# TYPE {METRICS_PREFIX}{name} {kind}', *name_samples]
+        return '\n'.join(lines) + '\n'
+
+def serve_metrics(metrics, port):
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = metrics.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('0.0.0.0', port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    logger.info(f'Serving metrics on port {port}')
+
+@st.cache_resource
+def get_metrics():
+    metrics = Metrics()
+    if METRICS_PORT:
+        try:
+            serve_metrics(metrics, METRICS_PORT)
+        except OSError as e:
+            logger.warning(f'Could not serve metrics on port {METRICS_PORT}: {e}')
+    return metrics
+
+# Looked up once per run, so background threads can record metrics without going through the Streamlit cache
+metrics = get_metrics()
+# Spans of the current run, for the debug panel. The script is executed afresh on every rerun, so this starts empty
+rerun_spans = deque(maxlen=RERUN_SPAN_LIMIT)
+
+@contextmanager
+def span(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        rerun_spans.append((stage, elapsed))
+        metrics.observe('stage_seconds', elapsed, SECONDS_BUCKETS, stage=stage)
+
+def count_cache_lookup(cache, hit):
+    metrics.inc('cache_lookups_total', cache=cache)
+    if not hit:
+        metrics.inc('cache_misses_total', cache=cache)
+
+def is_missing_key(error):
+    # Without s3:ListBucket, S3 answers a missing key with 403 AccessDenied instead of 404
+    return error.response.get('Error', {}).get('Code') in ('NoSuchKey', '404', 'AccessDenied', '403')
+
+def to_local_time(timestamp):
+    # Convert S3 timestamps to Singapore time
+    return timestamp.astimezone(pytz.timezone('Asia/Singapore'))
+
+def read_json_object(bucket_name, key, etag=None):
+    """Conditional GET of a JSON object from S3.
+
+    Returns (data, etag, last modified time), or None if the object still matches the given etag.
+    """
+    kwargs = {'IfNoneMatch': etag} if etag else {}
+    try:
+        with span('s3_get'):
+            response = s3.get_object(Bucket=bucket_name, Key=key, **kwargs)
+            body = response['Body'].read()
+    except ClientError as e:
+        if e.response.get('ResponseMetadata', {}).get('HTTPStatusCode') == 304:
+            metrics.inc('s3_not_modified_total')
+            return None
+        raise
+    metrics.observe('payload_bytes', len(body), BYTES_BUCKETS, kind='s3_object')
+    with span('json_parse'):
+        data = json.loads(body.decode('utf-8'))
+    return data, response['ETag'], to_local_time(response['LastModified'])
+
+def convert_reviews(df):
+    # Build the compact, typed columns once at ingest, so the render path never has to convert them again
+    df['DateOfReview'] = pd.to_datetime(df['DateOfReview'], format='%Y-%m-%d')
+    df['StarRating'] = pd.to_numeric(df['StarRating']).astype('int8')
+    df['month_year'] = df['DateOfReview'].dt.to_period('M')
+    df['ReviewDescription'] = df['ReviewDescription'].astype('string[pyarrow]')
+    df['HasDescription'] = (df['ReviewDescription'] != 'nil').to_numpy(dtype=bool, na_value=False)
+    return df
+
+def process_reviews(restaurant_reviews):
+    """Build the review frames of many restaurants in one vectorized pass.
+
+    restaurant_reviews maps each restaurant to its list of raw reviews. They are flattened into one
+    table with a categorical Restaurant column, converted and sorted once, and every restaurant
+    gets a zero-copy slice of its rows, newest first.
+    """
+    restaurants = list(restaurant_reviews)
+    counts = np.array([len(reviews) for reviews in restaurant_reviews.values()], dtype=np.int64)
+    df = pd.DataFrame(
+        [review for reviews in restaurant_reviews.values() for review in reviews],
+        columns=['DateOfReview', 'StarRating', 'ReviewDescription'],
+    )
+    df['Restaurant'] = pd.Categorical.from_codes(np.repeat(np.arange(len(restaurants)), counts), categories=restaurants)
+    df = convert_reviews(df)
+    df = df.sort_values(by=['Restaurant', 'DateOfReview'], ascending=[True, False], ignore_index=True)
+    df = df.drop(columns='Restaurant')
+
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+    return {
+        restaurant: df.iloc[offsets[i]:offsets[i + 1]].reset_index(drop=True)
+        for i, restaurant in enumerate(restaurants)
+    }
+
+@dataclass(frozen=True)
+class Dataset:
+    """One immutable version of the data, shared by every session.
+
+    frames is filled lazily with (reviews, summary, ngram) per restaurant, text_indexes with
+    the TextIndex of its reviews and chart_rollups with their ChartRollup. They are never modified
+    after they are built, and are carried over to the next version when the index entry of the
+    restaurant is unchanged. legacy_data only holds the parsed JSON of the legacy restaurants with
+    neither a frame nor a snapshot, each entry is dropped once its frame is loaded. Frames are loaded under
+    load_lock, so each one is only built once however many sessions ask for it at the same time.
+    Text indexes and chart rollups are also added under load_lock.
+    """
+    version: int
+    index: dict
+    updated_time: datetime
+    data_file_name: str = None
+    etag: str = None
+    legacy_data: dict = field(default_factory=dict)
+    frames: dict = field(default_factory=dict)
+    text_indexes: dict = field(default_factory=dict)
+    chart_rollups: dict = field(default_factory=dict)
+    load_lock: threading.Lock = field(default_factory=threading.Lock, compare=False, repr=False)
+
+def snapshot_path(name):
+    return os.path.join(snapshot_dir, name)
+
+def frame_snapshot_name(restaurant, entry):
+    # A restaurant's snapshot is only valid for the index entry (shard key and last_modified) it was built from
+    key = json.dumps([restaurant, entry], sort_keys=True)
+    return hashlib.sha1(key.encode('utf-8')).hexdigest() + '.arrow'
+
+def write_index_snapshot(bucket_name, dataset):
+    snapshot = {
+        'bucket_name': bucket_name,
+        'data_file_name': dataset.data_file_name,
+        'etag': dataset.etag,
+        'updated_time': dataset.updated_time.isoformat(),
+        'index': dataset.index,
+    }
+    try:
+        os.makedirs(snapshot_dir, exist_ok=True)
+        tmp_path = snapshot_path(SNAPSHOT_INDEX_NAME + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_path, snapshot_path(SNAPSHOT_INDEX_NAME))
+
+        # Remove the frames of restaurants that are no longer in the index
+        current = {SNAPSHOT_INDEX_NAME} | {frame_snapshot_name(restaurant, entry) for restaurant, entry in dataset.index.items()}
+        for name in os.listdir(snapshot_dir):
+            if name.endswith('.arrow') and name not in current:
+                os.remove(snapshot_path(name))
+    except OSError as e:
+        logger.warning(f'Could not write snapshot index: {e}')
+
+def load_index_snapshot(bucket_name):
+    try:
+        with open(snapshot_path(SNAPSHOT_INDEX_NAME), encoding='utf-8') as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if snapshot['bucket_name'] != bucket_name:
+        return None
+    logger.info(f'Loaded snapshot of {snapshot["data_file_name"]} with ETag {snapshot["etag"]}')
+    return Dataset(
+        version=0,
+        index=snapshot['index'],
+        updated_time=datetime.fromisoformat(snapshot['updated_time']),
+        data_file_name=snapshot['data_file_name'],
+        etag=snapshot['etag'],
+    )
+
+def write_frame_snapshot(restaurant, entry, frame):
+    df, summary, ngram = frame
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        metadata = dict(table.schema.metadata or {})
+        metadata[SNAPSHOT_METADATA_KEY] = json.dumps({'summary': summary, 'ngram': ngram}).encode('utf-8')
+        table = table.replace_schema_metadata(metadata)
+
+        os.makedirs(snapshot_dir, exist_ok=True)
+        path = snapshot_path(frame_snapshot_name(restaurant, entry))
+        # Two dataset versions can still build the same restaurant at once, so each writer has its own temporary file
+        tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        with pa.OSFile(tmp_path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(tmp_path, path)
+    except (OSError, pa.ArrowException) as e:
+        logger.warning(f'Could not write snapshot for {restaurant}: {e}')
+
+def has_frame_snapshot(restaurant, entry):
+    return os.path.exists(snapshot_path(frame_snapshot_name(restaurant, entry)))
+
+def read_frame_snapshot(restaurant, entry):
+    path = snapshot_path(frame_snapshot_name(restaurant, entry))
+    if not os.path.exists(path):
+        return None
+    try:
+        # Memory-mapped, so the review text is read zero-copy from the file
+        table = pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+        extra = json.loads(table.schema.metadata[SNAPSHOT_METADATA_KEY])
+        df = table.to_pandas(types_mapper={pa.large_string(): pd.StringDtype('pyarrow')}.get)
+    except (OSError, KeyError, ValueError, pa.ArrowException) as e:
+        logger.warning(f'Could not read snapshot for {restaurant}: {e}')
+        return None
+    return df, extra['summary'], extra['ngram']
+
+@st.cache_resource
+def get_data_store():
+    # Process-wide store of the current dataset, updated by refresh_data.
+    # It starts from the local snapshot if there is one, so S3 is only downloaded again when its ETag has changed
+    dataset = load_index_snapshot(bucket_name)
+    if dataset is None:
+        dataset = Dataset(version=0, index={}, updated_time=to_local_time(datetime.min.replace(tzinfo=pytz.UTC)))
+    return {
+        'lock': threading.Lock(),
+        'checked_at': None,
+        'manifest_probed_at': None,
+        'dataset': dataset,
+    }
+
+def fetch_index(bucket_name, manifest_file_name, json_file_name, data_file_name, etag, probe_manifest=True):
+    """Fetch the restaurant index, preferring the manifest over the legacy single file.
+
+    Returns (index, legacy data, data file name, etag, last modified time), or None if the
+    data file is unchanged. The index maps each restaurant name to the key of its shard
+    (None for the legacy layout) and its last_modified info. The manifest is only looked
+    for when probe_manifest is set.
+    """
+    if probe_manifest:
+        try:
+            result = read_json_object(bucket_name, manifest_file_name, etag if data_file_name == manifest_file_name else None)
+        except ClientError as e:
+            if S3_LAYOUT == 'sharded' or not is_missing_key(e):
+                raise
+        else:
+            if result is None:
+                return None
+            manifest, etag, updated_time = result
+            return manifest['restaurants'], {}, manifest_file_name, etag, updated_time
+        logger.info(f'Manifest {manifest_file_name} not found, reading legacy file {json_file_name}')
+
+    result = read_json_object(bucket_name, json_file_name, etag if data_file_name == json_file_name else None)
+    if result is None:
+        return None
+    data, etag, updated_time = result
+    index = {
+        restaurant: {'key': None, 'last_modified': restaurant_info['last_modified']}
+        for restaurant, restaurant_info in data.items()
+    }
+    return index, data, json_file_name, etag, updated_time
+
+def refresh_data(bucket_name, manifest_file_name, json_file_name, force=False):
+    """Check S3 for new data, at most once every UPDATE_CHECK_INTERVAL seconds across all sessions.
+
+    Returns the current Dataset.
+    """
+    store = get_data_store()
+    with store['lock']:
+        if force or store['checked_at'] is None or time.monotonic() - store['checked_at'] >= UPDATE_CHECK_INTERVAL:
+            now = time.monotonic()
+            store['checked_at'] = now
+            dataset = store['dataset']
+            # Once the legacy file is in use, the missing manifest is only asked for again every MANIFEST_PROBE_INTERVAL
+            probe_manifest = S3_LAYOUT == 'sharded' or (S3_LAYOUT == 'auto' and (
+                dataset.data_file_name != json_file_name
+                or store['manifest_probed_at'] is None
+                or now - store['manifest_probed_at'] >= MANIFEST_PROBE_INTERVAL
+            ))
+            if probe_manifest:
+                store['manifest_probed_at'] = now
+            result = fetch_index(bucket_name, manifest_file_name, json_file_name, dataset.data_file_name, dataset.etag, probe_manifest)
+            if result is None:
+                logger.info(f'Live DB not modified since {dataset.updated_time}')
+            else:
+                index, legacy_data, data_file_name, etag, updated_time = result
+                unchanged = {restaurant for restaurant, entry in dataset.index.items() if index.get(restaurant) == entry}
+                # Other sessions keep adding to these dicts without the store lock, so each is copied at once before filtering
+                frames = {restaurant: frame for restaurant, frame in dict(dataset.frames).items() if restaurant in unchanged}
+                text_indexes = {restaurant: text_index for restaurant, text_index in dict(dataset.text_indexes).items() if restaurant in unchanged}
+                chart_rollups = {restaurant: rollup for restaurant, rollup in dict(dataset.chart_rollups).items() if restaurant in unchanged}
+                changed = [restaurant for restaurant, entry in index.items() if dataset.index.get(restaurant) != entry]
+                # The parsed JSON is only kept for restaurants with neither a frame nor a snapshot to load it from
+                legacy_data = {
+                    restaurant: restaurant_info for restaurant, restaurant_info in legacy_data.items()
+                    if restaurant not in frames and not has_frame_snapshot(restaurant, index[restaurant])
+                }
+                store['dataset'] = Dataset(
+                    version=dataset.version + 1,
+                    index=index,
+                    updated_time=updated_time,
+                    data_file_name=data_file_name,
+                    etag=etag,
+                    legacy_data=legacy_data,
+                    frames=frames,
+                    text_indexes=text_indexes,
+                    chart_rollups=chart_rollups,
+                )
+                write_index_snapshot(bucket_name, store['dataset'])
+                logger.info(f'Live DB last modified date: {updated_time}, {len(changed)} restaurant(s) changed')
+        return store['dataset']
+
+def fetch_restaurant_info(bucket_name, dataset, restaurant):
+    shard_key = dataset.index[restaurant]['key']
+    if shard_key is None:
+        data, _, _ = read_json_object(bucket_name, dataset.data_file_name)
+        return data[restaurant]
+    restaurant_info, _, _ = read_json_object(bucket_name, shard_key)
+    return restaurant_info
+
+def merge_restaurant_summary(store, bucket_name, restaurant, restaurant_info):
+    """Replace the summary of one restaurant in a new dataset version, every other restaurant is kept as it is."""
+    with store['lock']:
+        dataset = store['dataset']
+        if restaurant not in dataset.index:
+            return dataset
+        old_entry = dataset.index[restaurant]
+        entry = dict(old_entry, last_modified=restaurant_info['last_modified'])
+        frames = dict(dataset.frames)
+        text_indexes = dict(dataset.text_indexes)
+        chart_rollups = dict(dataset.chart_rollups)
+        legacy_data = dict(dataset.legacy_data)
+
+        frame = frames.get(restaurant)
+        if frame is not None and old_entry['last_modified'].get('scrape') == entry['last_modified'].get('scrape'):
+            # The reviews are unchanged, so the frame, its text index and chart rollup are reused with the new summary
+            frames[restaurant] = (frame[0], restaurant_info['summary'], restaurant_info['ngram'])
+            write_frame_snapshot(restaurant, entry, frames[restaurant])
+            legacy_data.pop(restaurant, None)
+        else:
+            frames.pop(restaurant, None)
+            text_indexes.pop(restaurant, None)
+            chart_rollups.pop(restaurant, None)
+            if entry['key'] is None:
+                legacy_data[restaurant] = restaurant_info
+
+        store['dataset'] = replace(
+            dataset,
+            version=dataset.version + 1,
+            index={**dataset.index, restaurant: entry},
+            legacy_data=legacy_data,
+            frames=frames,
+            text_indexes=text_indexes,
+            chart_rollups=chart_rollups,
+        )
+        write_index_snapshot(bucket_name, store['dataset'])
+        logger.info(f'Summary of {restaurant} merged into dataset v{store["dataset"].version}')
+        return store['dataset']
+
+def fetch_restaurant_infos(dataset, bucket_name, restaurants):
+    infos = {}
+    shards = {}
+    for restaurant in restaurants:
+        shard_key = dataset.index[restaurant]['key']
+        if shard_key is not None:
+            shards[restaurant] = shard_key
+        elif restaurant in dataset.legacy_data:
+            infos[restaurant] = dataset.legacy_data[restaurant]
+    missing = [restaurant for restaurant in restaurants if restaurant not in infos and restaurant not in shards]
+    if missing:
+        # Started from a snapshot, or the parsed JSON was dropped, so the legacy file is downloaded again.
+        # Only the restaurants asked for are kept from it
+        data, _, _ = read_json_object(bucket_name, dataset.data_file_name)
+        infos.update((restaurant, data[restaurant]) for restaurant in missing)
+    if shards:
+        with ThreadPoolExecutor(max_workers=S3_FETCH_WORKERS) as executor:
+            results = executor.map(lambda shard_key: read_json_object(bucket_name, shard_key), shards.values())
+            for restaurant, (restaurant_info, _, _) in zip(shards, results):
+                infos[restaurant] = restaurant_info
+    return infos
+
+def load_restaurants(dataset, bucket_name, restaurants):
+    """Load the frames of the given restaurants, from their snapshots when possible, else all in one pass."""
+    with dataset.load_lock:
+        # Sessions that were waiting for the lock skip the restaurants loaded in the meantime
+        load_missing_restaurants(dataset, bucket_name, restaurants)
+
+def load_missing_restaurants(dataset, bucket_name, restaurants):
+    dataset.frames.update(read_frames(dataset, bucket_name, [restaurant for restaurant in restaurants if restaurant not in dataset.frames]))
+
+def read_frames(dataset, bucket_name, restaurants):
+    """Return the frames of the given restaurants, from their snapshots when possible, else all built in one pass.
+
+    Built frames are written to snapshots. The frames are not stored in the dataset.
+    """
+    frames = {}
+    missing = []
+    for restaurant in restaurants:
+        with span('snapshot_read'):
+            frame = read_frame_snapshot(restaurant, dataset.index[restaurant])
+        if frame is None:
+            missing.append(restaurant)
+        else:
+            frames[restaurant] = frame
+            dataset.legacy_data.pop(restaurant, None)
+            logger.info(f'Reviews for {restaurant} loaded from snapshot')
+    if not missing:
+        return frames
+
+    infos = fetch_restaurant_infos(dataset, bucket_name, missing)
+    with span('frame_build'):
+        reviews = process_reviews({restaurant: infos[restaurant]['data'] for restaurant in missing})
+    for restaurant in missing:
+        frame = (reviews[restaurant], infos[restaurant]['summary'], infos[restaurant]['ngram'])
+        write_frame_snapshot(restaurant, dataset.index[restaurant], frame)
+        frames[restaurant] = frame
+        # The frame or its snapshot replaces the parsed JSON, so the reviews are only held once
+        dataset.legacy_data.pop(restaurant, None)
+    logger.info(f'Reviews for {len(missing)} restaurant(s) built')
+    log_memory_usage(dataset)
+    return frames
+
+def get_restaurant_data(dataset, bucket_name, restaurant):
+    frame = dataset.frames.get(restaurant)
+    count_cache_lookup('frames', frame is not None)
+    if frame is not None:
+        return frame
+
+    restaurants = [restaurant]
+    entry = dataset.index[restaurant]
+    if entry['key'] is None and not has_frame_snapshot(restaurant, entry):
+        # The legacy file holds every restaurant, so the ones without a snapshot are all built in the same pass
+        restaurants += [
+            other for other, other_entry in dataset.index.items()
+            if other != restaurant and other_entry['key'] is None and other not in dataset.frames
+            and not has_frame_snapshot(other, other_entry)
+        ]
+    load_restaurants(dataset, bucket_name, restaurants)
+    return dataset.frames[restaurant]
+
+def dataset_memory_usage(dataset):
+    # Bytes held by each loaded restaurant. There is a single copy per process, however many sessions are open
+    return pd.Series(
+        {restaurant: int(df.memory_usage(deep=True).sum()) for restaurant, (df, _, _) in list(dataset.frames.items())},
+        dtype='int64',
+    )
+
+def log_memory_usage(dataset):
+    usage = dataset_memory_usage(dataset)
+    logger.info(
+        f'Dataset v{dataset.version}: {len(usage)} restaurant(s) loaded, {usage.sum() / 1e6:.2f} MB shared by all sessions, '
+        f'{len(dataset.legacy_data)} restaurant(s) still held as parsed JSON'
+    )
+
+@dataclass(frozen=True)
+class TextIndex:
+    """Inverted index from the words of the review descriptions of one restaurant to their rows."""
+    vocabulary: list  # Sorted words
+    offsets: np.ndarray  # The rows of vocabulary[i] are rows[offsets[i]:offsets[i + 1]]
+    rows: np.ndarray  # Row labels in the restaurant frame
+    num_rows: int
+
+def tokenize_text(text):
+    return re.sub(r'[^\w\s]', ' ', text.lower()).split()
+
+def build_text_index(df):
+    descriptions = df.loc[df['HasDescription'], 'ReviewDescription']
+    words = descriptions.str.lower().str.replace(r'[^\w\s]', ' ', regex=True).str.split().explode().dropna()
+    pairs = pd.DataFrame({'word': words.to_numpy(dtype=object), 'row': words.index.to_numpy()}).drop_duplicates()
+    codes, vocabulary = pd.factorize(pairs['word'], sort=True)
+    offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(np.bincount(codes, minlength=len(vocabulary)))
+    return TextIndex(
+        vocabulary=vocabulary.tolist(),
+        offsets=offsets,
+        rows=pairs['row'].to_numpy(dtype=np.int32)[np.argsort(codes, kind='stable')],
+        num_rows=len(df),
+    )
+
+def get_text_index(dataset, bucket_name, restaurant):
+    text_index = dataset.text_indexes.get(restaurant)
+    count_cache_lookup('text_index', text_index is not None)
+    if text_index is None:
+        reviews, _, _ = get_restaurant_data(dataset, bucket_name, restaurant)
+        text_index = build_text_index(reviews)
+        with dataset.load_lock:
+            # A session that built the same index at the same time keeps the first one
+            text_index = dataset.text_indexes.setdefault(restaurant, text_index)
+        logger.info(f'Text index for {restaurant} built ({len(text_index.vocabulary)} words)')
+    return text_index
+
+@dataclass(frozen=True)
+class ChartRollup:
+    """Star ratings of one restaurant, aggregated for the charts.
+
+    Row 0 of each array counts the reviews with no description, row 1 the reviews with one.
+    """
+    months: pd.PeriodIndex  # Sorted months with at least one review
+    rating_counts: np.ndarray  # (2, 5): reviews per star rating, 1 to 5
+    monthly_sum: np.ndarray  # (2, len(months)): sum of the star ratings per month
+    monthly_count: np.ndarray  # (2, len(months)): reviews per month
+
+def build_chart_rollup(df):
+    has_description = df['HasDescription'].to_numpy(dtype=np.int64)
+    ratings = df['StarRating'].to_numpy(dtype=np.int64)
+    month_codes, months = pd.factorize(df['month_year'], sort=True)
+    num_months = len(months)
+    month_keys = has_description * num_months + month_codes
+    return ChartRollup(
+        months=months,
+        rating_counts=np.bincount(has_description * 5 + ratings - 1, minlength=10).reshape(2, 5),
+        monthly_sum=np.bincount(month_keys, weights=ratings, minlength=2 * num_months).reshape(2, num_months),
+        monthly_count=np.bincount(month_keys, minlength=2 * num_months).reshape(2, num_months),
+    )
+
+def get_chart_rollup(dataset, bucket_name, restaurant):
+    rollup = dataset.chart_rollups.get(restaurant)
+    count_cache_lookup('chart_rollup', rollup is not None)
+    if rollup is None:
+        reviews, _, _ = get_restaurant_data(dataset, bucket_name, restaurant)
+        rollup = build_chart_rollup(reviews)
+        with dataset.load_lock:
+            rollup = dataset.chart_rollups.setdefault(restaurant, rollup)
+        logger.info(f'Chart rollup for {restaurant} built ({len(rollup.months)} months)')
+    return rollup
+
+def search_reviews(text_index, reviews, query):
+    """Return a bitmap over the rows of reviews, True for the reviews containing every word and quoted phrase of query."""
+    phrases = re.findall(r'"([^"]+)"', query)
+    words = tokenize_text(re.sub(r'"[^"]*"', ' ', query)) + [word for phrase in phrases for word in tokenize_text(phrase)]
+
+    bitmap = np.ones(text_index.num_rows, dtype=bool)
+    for word in set(words):
+        i = bisect.bisect_left(text_index.vocabulary, word)
+        word_bitmap = np.zeros(text_index.num_rows, dtype=bool)
+        if i < len(text_index.vocabulary) and text_index.vocabulary[i] == word:
+            word_bitmap[text_index.rows[text_index.offsets[i]:text_index.offsets[i + 1]]] = True
+        bitmap &= word_bitmap
+
+    # The index only knows the words of a phrase, so check their order on the remaining rows
+    for phrase in phrases:
+        candidates = np.flatnonzero(bitmap)
+        contains = reviews['ReviewDescription'].iloc[candidates].str.contains(phrase, case=False, regex=False)
+        bitmap[candidates[~contains.to_numpy(dtype=bool, na_value=False)]] = False
+    return bitmap
+
+def normalize_name(name):
+    # Lowercase and drop accents and punctuation, so 'Café - Branch' and 'cafe branch' compare equal
+    name = ''.join(c for c in unicodedata.normalize('NFKD', name.lower()) if not unicodedata.combining(c))
+    return ' '.join(re.findall(r'\w+', name))
+
+def name_trigrams(text):
+    padded = f' {text} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+@dataclass(frozen=True)
+class NameIndex:
+    """Search index over the restaurant names of one dataset version."""
+    names: np.ndarray
+    normalized: list
+    lengths: np.ndarray
+    sorted_names: list  # Normalized names in sorted order, for prefix lookups with bisect
+    sorted_ids: np.ndarray
+    words: list  # Sorted words of every name, for word prefix lookups with bisect
+    word_ids: np.ndarray
+    trigrams: dict  # Trigram -> sorted array of the ids of the names containing it
+    trigram_counts: np.ndarray
+    short_grams: dict  # Substring of one or two characters -> sorted array of the ids of the names containing it
+
+def build_name_index(names):
+    normalized = [normalize_name(name) for name in names]
+    sorted_ids = sorted(range(len(normalized)), key=normalized.__getitem__)
+    words = sorted((word, i) for i, text in enumerate(normalized) for word in set(text.split()))
+    postings = defaultdict(list)
+    short_postings = defaultdict(list)
+    trigram_counts = []
+    for i, text in enumerate(normalized):
+        grams = name_trigrams(text)
+        trigram_counts.append(len(grams))
+        for gram in grams:
+            postings[gram].append(i)
+        for gram in set(text) | {text[j:j + 2] for j in range(len(text) - 1)}:
+            short_postings[gram].append(i)
+    return NameIndex(
+        names=np.array(names, dtype=object),
+        normalized=normalized,
+        lengths=np.array([len(text) for text in normalized], dtype=np.int32),
+        sorted_names=[normalized[i] for i in sorted_ids],
+        sorted_ids=np.array(sorted_ids, dtype=np.int32),
+        words=[word for word, _ in words],
+        word_ids=np.array([i for _, i in words], dtype=np.int32),
+        trigrams={gram: np.array(ids, dtype=np.int32) for gram, ids in postings.items()},
+        trigram_counts=np.array(trigram_counts, dtype=np.int32),
+        short_grams={gram: np.array(ids, dtype=np.int32) for gram, ids in short_postings.items()},
+    )
+
+@st.cache_resource(max_entries=2)
+def get_name_index(dataset_version, _names):
+    # Built once per dataset version and shared by every session
+    metrics.inc('cache_misses_total', cache='name_index')
+    index = build_name_index(_names)
+    logger.info(f'Name index built for dataset v{dataset_version} ({len(_names)} names)')
+    return index
+
+def prefix_range(keys, prefix):
+    return bisect.bisect_left(keys, prefix), bisect.bisect_left(keys, prefix + '\uffff')
+
+def search_names(index, query):
+    """Return the names matching query, best matches first.
+
+    Names are ranked in tiers: exact match, then names starting with the query, then names where every
+    word of the query starts a word of the name (in any order), then names containing the query, then up
+    to NAME_SEARCH_FUZZY_LIMIT names sharing most of the trigrams of the query (typos). Ties are broken
+    by trigram similarity, then by length.
+    """
+    query = normalize_name(query)
+    if not query:
+        return index.names.tolist()
+    tiers = np.full(len(index.names), NAME_SEARCH_NO_MATCH, dtype=np.int8)
+
+    # Every word of the query starts a word of the name, in any order
+    words_matched = np.ones(len(index.names), dtype=bool)
+    for word in query.split():
+        word_matched = np.zeros(len(index.names), dtype=bool)
+        word_matched[index.word_ids[slice(*prefix_range(index.words, word))]] = True
+        words_matched &= word_matched
+    tiers[words_matched] = 2
+
+    # Substring matches. A name can only contain the query if it contains every trigram inside the query.
+    # Queries of one or two characters have no inner trigram, and are looked up whole in short_grams instead
+    inner_grams = {query[i:i + 3] for i in range(len(query) - 2)}
+    if not inner_grams:
+        candidates = index.short_grams.get(query, np.array([], dtype=np.int32))
+        tiers[candidates[tiers[candidates] > 3]] = 3
+    elif all(gram in index.trigrams for gram in inner_grams):
+        inner_shared = np.bincount(np.concatenate([index.trigrams[gram] for gram in inner_grams]), minlength=len(index.names))
+        candidates = np.flatnonzero((inner_shared == len(inner_grams)) & (tiers > 3))
+        if len(inner_grams) > 1:
+            candidates = [i for i in candidates if query in index.normalized[i]]
+        tiers[candidates] = 3
+
+    start, end = prefix_range(index.sorted_names, query)
+    tiers[index.sorted_ids[start:end]] = 1
+    exact_end = bisect.bisect_right(index.sorted_names, query, start, end)
+    tiers[index.sorted_ids[start:exact_end]] = 0
+
+    query_grams = name_trigrams(query)
+    postings = [index.trigrams[gram] for gram in query_grams if gram in index.trigrams]
+    shared = np.bincount(np.concatenate(postings), minlength=len(index.names)) if postings else np.zeros(len(index.names), dtype=np.int64)
+    fuzzy = np.flatnonzero((tiers == NAME_SEARCH_NO_MATCH) & (shared >= NAME_SEARCH_MIN_OVERLAP * len(query_grams)))
+    if len(fuzzy) > NAME_SEARCH_FUZZY_LIMIT:
+        fuzzy = fuzzy[np.argpartition(-shared[fuzzy], NAME_SEARCH_FUZZY_LIMIT)[:NAME_SEARCH_FUZZY_LIMIT]]
+    tiers[fuzzy] = 4
+
+    matched = np.flatnonzero(tiers < NAME_SEARCH_NO_MATCH)
+    similarity = shared[matched] / (len(query_grams) + index.trigram_counts[matched] - shared[matched])
+    order = matched[np.lexsort((index.lengths[matched], -similarity, tiers[matched]))]
+    return index.names[order].tolist()
+
+@st.cache_resource
+def get_backend_session():
+    # One pooled session shared by every session of the app, so backend calls reuse their TCP/TLS connections.
+    # Only connection errors are retried for POST, so a scrape or analysis is never started twice
+    retry = Retry(
+        total=BACKEND_RETRIES,
+        backoff_factor=BACKEND_BACKOFF,
+        status_forcelist=(502, 503, 504),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_maxsize=BACKEND_POOL_SIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+@st.cache_resource
+def get_backend_executor():
+    return ThreadPoolExecutor(max_workers=BACKEND_POOL_SIZE, thread_name_prefix='backend')
+
+def send_backend_request(session, method, path, timeout=None, **kwargs):
+    endpoint = '/' + path.lstrip('/').split('/')[0]  # '/status/<id>' is counted as '/status'
+    outcome = 'error'
+    try:
+        with span(f'backend_http {endpoint}'):
+            response = session.request(
+                method,
+                f'{flask_url}{path}',
+                timeout=(BACKEND_CONNECT_TIMEOUT, timeout or BACKEND_READ_TIMEOUT),
+                **kwargs,
+            )
+        outcome = str(response.status_code)
+        return response
+    finally:
+        metrics.inc('backend_requests_total', endpoint=endpoint, outcome=outcome)
+
+def backend_request(method, path, timeout=None, session=None, **kwargs):
+    # Background jobs pass the session in, since cached resources can only be read from the script thread
+    return send_backend_request(session or get_backend_session(), method, path, timeout, **kwargs)
+
+def is_final_status(status):
+    return status == 'Completed' or 'Failed' in status
+
+class StatusWatcher:
+    """Polls the status of every outstanding scraping request from one background thread.
+
+    Sessions waiting on the same request_id share its polls, and only read the latest status from memory.
+    """
+
+    def __init__(self, session):
+        self._session = session
+        self._lock = threading.Lock()
+        self._statuses = {}  # request_id -> (status, time of the last change)
+        self._wake = threading.Event()
+        threading.Thread(target=self._run, name='status-watcher', daemon=True).start()
+
+    def watch(self, request_id, status='In Progress'):
+        with self._lock:
+            if request_id in self._statuses:
+                return
+            self._statuses[request_id] = (status, time.monotonic())
+        # Poll a new request straight away
+        self._wake.set()
+
+    def status(self, request_id):
+        with self._lock:
+            status, _ = self._statuses.get(request_id, (None, None))
+        return status
+
+    def _run(self):
+        while True:
+            self._wake.wait(STATUS_POLL_INTERVAL)
+            self._wake.clear()
+            with self._lock:
+                # Finished requests are kept for a while for the sessions that have not seen them yet
+                now = time.monotonic()
+                self._statuses = {
+                    request_id: (status, changed_at) for request_id, (status, changed_at) in self._statuses.items()
+                    if not is_final_status(status) or now - changed_at < FINISHED_STATUS_TTL
+                }
+                pending = [request_id for request_id, (status, _) in self._statuses.items() if not is_final_status(status)]
+
+            for request_id in pending:
+                try:
+                    response = send_backend_request(self._session, 'GET', f'/status/{request_id}')
+                    status = response.json().get('status')
+                except (requests.RequestException, ValueError) as e:
+                    logger.error(f"Status request for {request_id} failed: {e}")
+                    continue
+                with self._lock:
+                    if status and status != self._statuses[request_id][0]:
+                        logger.info(f"Status of {request_id}: {status}")
+                        self._statuses[request_id] = (status, time.monotonic())
+
+@st.cache_resource
+def get_status_watcher():
+    return StatusWatcher(get_backend_session())
+
+@st.experimental_fragment(run_every=STATUS_CHECK_INTERVAL)
+def watch_request_status():
+    # Only this fragment reruns while a request is in progress. It reads the status from the shared
+    # watcher, and reruns the whole page once the request has completed or failed
+    status = get_status_watcher().status(st.session_state.request_id)
+    if status is not None and status != st.session_state.status:
         st.session_state.status = status
-        logger.info(f"Status: {status}")
+        if is_final_status(status):
+            st.rerun()
 
 def send_scraping_request(res_name, loc_name, review_limit):
-    url = f'{flask_url}/scrape'
     reviews_df = {
         'business_name': f'{res_name} - {loc_name}',
         'sort_order': 'Newest',
         'review_limit': str(review_limit)
     }
-    response = requests.post(url, json=reviews_df)
-    return response.json().get('request_id')
+    try:
+        response = backend_request('POST', '/scrape', json=reviews_df)
+        return response.json().get('request_id')
+    except (requests.RequestException, ValueError) as e:
+        logger.error(f"Scraping request failed: {e}")
+        return None
 
-def analyze_reviews(res_name, df):
-    url = f'{flask_url}/analyze'
-    reviews_df = {"res_name": res_name, "reviews": df.to_dict(orient='records')}
-    response = requests.post(url, json=reviews_df)
-    if response.status_code == 200:
-        logger.info("Success:")
-    else:
-        logger.error(f"Request failed with status code: {response.status_code}")
+def review_hashes(df):
+    # Content hash of each review, the same review always gets the same hash
+    return [
+        hashlib.blake2b(f'{rating}\t{description}'.encode('utf-8'), digest_size=16).hexdigest()
+        for description, rating in zip(df['ReviewDescription'], df['StarRating'])
+    ]
+
+def summarized_hashes_path(res_name):
+    return snapshot_path(os.path.join(SUMMARIZED_DIR_NAME, hashlib.sha1(res_name.encode('utf-8')).hexdigest() + '.json'))
+
+def load_summarized_hashes(res_name, last_modified):
+    # The hashes only hold while the restaurant is as it was after the upload. Once its reviews are scraped
+    # again or its summary is regenerated elsewhere, every review is sent again
+    try:
+        with open(summarized_hashes_path(res_name), encoding='utf-8') as f:
+            summarized = json.load(f)
+    except (OSError, ValueError):
+        return set()
+    if not isinstance(summarized, dict) or summarized.get('last_modified') != last_modified:
+        return set()
+    return set(summarized['hashes'])
+
+def save_summarized_hashes(res_name, hashes, last_modified):
+    path = summarized_hashes_path(res_name)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump({'last_modified': last_modified, 'hashes': sorted(hashes)}, f)
+        os.replace(path + '.tmp', path)
+    except OSError as e:
+        logger.warning(f'Could not save the summarized reviews of {res_name}: {e}')
+
+def ndjson_chunks(records, max_bytes):
+    chunk = []
+    size = 0
+    for record in records:
+        line = json.dumps(record, ensure_ascii=False).encode('utf-8') + b'\n'
+        if chunk and size + len(line) > max_bytes:
+            yield b''.join(chunk)
+            chunk = []
+            size = 0
+        chunk.append(line)
+        size += len(line)
+    if chunk:
+        yield b''.join(chunk)
+
+def analyze_reviews(res_name, df, summarized, session=None):
+    """Upload the reviews of a restaurant whose hashes are not in summarized to /analyze.
+
+    The reviews are sent as gzip'd NDJSON, in chunks of at most ANALYZE_CHUNK_BYTES before compression.
+    Every chunk carries the same upload_id, and the backend summarizes once the last chunk has arrived.
+    Returns the hashes of the uploaded reviews, empty if there was nothing new, or None if the upload failed.
+    """
+    uploaded = set()
+    records = []
+    for review_hash, description, rating in zip(review_hashes(df), df['ReviewDescription'], df['StarRating']):
+        if review_hash in summarized or review_hash in uploaded:
+            continue
+        uploaded.add(review_hash)
+        records.append({'hash': review_hash, 'ReviewDescription': description, 'StarRating': int(rating)})
+    if not records:
+        logger.info(f'No new reviews to summarize for {res_name}')
+        return uploaded
+
+    chunks = list(ndjson_chunks(records, ANALYZE_CHUNK_BYTES))
+    upload_id = uuid.uuid4().hex
+    for i, chunk in enumerate(chunks):
+        body = gzip.compress(chunk)
+        metrics.observe('payload_bytes', len(body), BYTES_BUCKETS, kind='analyze_upload')
+        try:
+            response = backend_request(
+                'POST',
+                '/analyze',
+                timeout=ANALYZE_READ_TIMEOUT,
+                session=session,
+                params={'res_name': res_name, 'upload_id': upload_id, 'chunk': i, 'chunks': len(chunks)},
+                headers={'Content-Type': 'application/x-ndjson', 'Content-Encoding': 'gzip'},
+                data=body,
+            )
+        except requests.RequestException as e:
+            logger.error(f"Request failed: {e}")
+            return None
+        if response.status_code != 200:
+            logger.error(f"Request failed with status code: {response.status_code}")
+            return None
+        logger.info(f'Uploaded chunk {i + 1}/{len(chunks)} for {res_name}: {len(chunk)} bytes, {len(body)} compressed')
+
+    logger.info(f"Success: {len(records)} new review(s) of {res_name} sent for summary")
+    return uploaded
+
+def run_summary_job(res_name, df, session, store):
+    # Returns 'updated', 'up to date' when no review is new since the last summary, or 'failed'
+    entry = store['dataset'].index.get(res_name)
+    if entry is None:
+        return 'failed'
+    summarized = load_summarized_hashes(res_name, entry['last_modified'])
+    uploaded = analyze_reviews(res_name, df, summarized, session)
+    if uploaded is None:
+        return 'failed'
+    if not uploaded:
+        return 'up to date'
+    try:
+        restaurant_info = fetch_restaurant_info(bucket_name, store['dataset'], res_name)
+    except (ClientError, BotoCoreError, KeyError, ValueError) as e:
+        logger.error(f"Could not read the new summary of {res_name}: {e}")
+        return 'failed'
+    merge_restaurant_summary(store, bucket_name, res_name, restaurant_info)
+    # Only remembered once the new summary is in, against its last_modified, so a failed upload is sent again in full
+    save_summarized_hashes(res_name, summarized | uploaded, restaurant_info['last_modified'])
+    return 'updated'
+
+@st.cache_resource
+def get_summary_jobs():
+    # Summary jobs shared by every session, restaurant -> Future of run_summary_job
+    return {'lock': threading.Lock(), 'jobs': {}}
+
+def start_summary_job(res_name, df):
+    # A restaurant has at most one job in flight, a second click joins the running one
+    summary_jobs = get_summary_jobs()
+    with summary_jobs['lock']:
+        job = summary_jobs['jobs'].get(res_name)
+        if job is None or job.done():
+            job = get_backend_executor().submit(run_summary_job, res_name, df, get_backend_session(), get_data_store())
+            summary_jobs['jobs'][res_name] = job
+    return job
+
+def get_summary_job(res_name):
+    summary_jobs = get_summary_jobs()
+    with summary_jobs['lock']:
+        return summary_jobs['jobs'].get(res_name)
+
+@st.experimental_fragment(run_every=STATUS_CHECK_INTERVAL)
+def watch_summary_job(res_name):
+    # Reruns the whole page once the job is done, so the new summary is shown
+    job = get_summary_job(res_name)
+    if job is None or job.done():
+        st.rerun()
+    st.info(f'Generating the AI summary of {res_name}, this can take a few minutes...')
 
 def remove_review(res_name):
-    url = f'{flask_url}/remove_review/{res_name}'
-    response = requests.delete(url)
+    try:
+        response = backend_request('DELETE', f'/remove_review/{res_name}')
+    except requests.RequestException as e:
+        logger.error(f"Request failed: {e}")
+        return
     if response.status_code == 200:
         logger.info(f"Review information for {res_name} has been removed")
     elif response.status_code == 404:
@@ -124,31 +1123,52 @@ def remove_review(res_name):
     else:
         logger.error(f"Request failed with status code: {response.status_code}")
 
+@st.cache_resource(max_entries=CHART_CACHE_SIZE)
+def get_charts(dataset_version, restaurant, show_empty_reviews, _dataset):
+    """Build the charts of a restaurant from its rollup, so no review is grouped again on a rerun.
 
-def display_charts(selected_df):
-
-    col1, col2 = st.columns([3, 2])
-    with col1:
-        show_empty_reviews = st.checkbox('Include reviews with no description', True)
-    with col2:
-        filtered_df = selected_df if show_empty_reviews else selected_df[selected_df['ReviewDescription'] != 'nil']
-        st.write(f"Displaying {len(filtered_df)} reviews") # Showing 100
+    Returns (line chart, bar chart, average rating).
+    """
+    metrics.inc('cache_misses_total', cache='charts')
+    rollup = get_chart_rollup(_dataset, bucket_name, restaurant)
+    rows = slice(None) if show_empty_reviews else slice(1, 2)
+    rating_counts = rollup.rating_counts[rows].sum(axis=0)
+    monthly_sum = rollup.monthly_sum[rows].sum(axis=0)
+    monthly_count = rollup.monthly_count[rows].sum(axis=0)
 
-    ratingGroupedDf = filtered_df.groupby('StarRating').size().reset_index(name='Count')
-    average_rating = round(filtered_df['StarRating'].mean(), 2)
+    ratings = np.flatnonzero(rating_counts)
+    ratingGroupedDf = pd.DataFrame({'StarRating': ratings + 1, 'Count': rating_counts[ratings]})
+    average_rating = round(monthly_sum.sum() / monthly_count.sum(), 2) if monthly_count.sum() else float('nan')
     chart = alt.Chart(ratingGroupedDf).mark_bar().encode(
         x=alt.X('StarRating:N', title='Star Rating', axis=alt.Axis(labelAngle=0)),
         y=alt.Y('Count:Q', title='Count'),
     ).properties(width=600, height=200)
 
-    monthlyGroupedDf = filtered_df.groupby('month_year')['StarRating'].agg(['mean', 'count']).reset_index()
-    monthlyGroupedDf.columns = ['Date', 'Star Rating', 'Num_Reviews']
-    monthlyGroupedDf['Star Rating'] = round(monthlyGroupedDf['Star Rating'], 2)
+    months = np.flatnonzero(monthly_count)
+    monthlyGroupedDf = pd.DataFrame({
+        'Date': rollup.months[months].to_timestamp(),
+        'Star Rating': np.round(monthly_sum[months] / monthly_count[months], 2),
+        'Num_Reviews': monthly_count[months],
+    })
     line_chart = alt.Chart(monthlyGroupedDf).mark_line(point=True).encode(
         x=alt.X('Date:T', title='Date [Month]'),
         y=alt.Y('Star Rating:Q', title='Average Star Rating'),
         tooltip=['Date:T', 'Star Rating:Q', 'Num_Reviews:Q']
     ).properties(width=600, height=200)
+    return line_chart, chart, average_rating
+
+def display_charts(selected_df, dataset, restaurant):
+
+    col1, col2 = st.columns([3, 2])
+    with col1:
+        show_empty_reviews = st.checkbox('Include reviews with no description', True)
+    with col2:
+        filtered_df = selected_df if show_empty_reviews else selected_df[selected_df['HasDescription']]
+        st.write(f"Displaying {len(filtered_df)} reviews") # Showing 100
+
+    with span('charts'):
+        metrics.inc('cache_lookups_total', cache='charts')
+        line_chart, chart, average_rating = get_charts(dataset.version, restaurant, show_empty_reviews, dataset)
 
     col1, col2 = st.columns(2)
     with col1:
@@ -158,59 +1178,196 @@ def display_charts(selected_df):
         st.subheader(f'Average Star Rating: {average_rating:.2f} ★')
         st.altair_chart(chart, use_container_width=True)
     st.divider()
-    return filtered_df
+    return filtered_df, show_empty_reviews
+
+def review_order(df, sort):
+    column, ascending = REVIEW_SORTS[sort]
+    # Stable, so reviews with the same rating stay newest first
+    order = np.argsort(df[column].to_numpy() if ascending else -df[column].to_numpy(dtype=np.int16), kind='stable')
+    order.flags.writeable = False
+    return order
+
+@st.cache_resource(max_entries=FILTER_CACHE_SIZE)
+def get_review_order(dataset_version, restaurant, rows_state, sort, _df):
+    # rows_state identifies the rows of _df: (include reviews with no description, filter state)
+    metrics.inc('cache_misses_total', cache='review_order')
+    return review_order(_df, sort)
+
+def sort_reviews(df, sort, start, stop, order_key=None):
+    """Return the rows start:stop of df in the given sort order, only taking the rows of the page.
+
+    order_key is (dataset version, restaurant, rows state) of df, to memoize the order of the rating sorts.
+    """
+    column, ascending = REVIEW_SORTS[sort]
+    if column == 'DateOfReview':
+        if not ascending:
+            return df.iloc[start:stop]
+        end = len(df)
+        return df.iloc[max(end - stop, 0):max(end - start, 0)].iloc[::-1]
+    if order_key is None:
+        order = review_order(df, sort)
+    else:
+        metrics.inc('cache_lookups_total', cache='review_order')
+        order = get_review_order(*order_key, sort, df)
+    return df.iloc[order[start:stop]]
+
+def display_reviews_df(filtered_df, dataset, restaurant, show_empty_reviews):
+    """Show one page of the filtered reviews.
 
-def display_reviews_df(filtered_df):
-    filtered_df = filter_dataframe(filtered_df)
+    Only the rows of the page are formatted and sent to the browser, with their descriptions cut to
+    REVIEW_PREVIEW_CHARS, so the payload does not grow with the number of reviews.
+    """
+    filtered_df = filter_dataframe(filtered_df, dataset, restaurant)
+
+    col1, col2, col3 = st.columns([2, 1, 1])
+    with col1:
+        sort = st.selectbox('Sort by', list(REVIEW_SORTS), key='review_sort')
+    with col2:
+        page_size = st.selectbox('Reviews per page', REVIEW_PAGE_SIZES, key='review_page_size')
+    num_pages = max(1, -(-len(filtered_df) // page_size))
+    if st.session_state.get('review_page', 1) > num_pages:
+        st.session_state.review_page = num_pages
+    with col3:
+        page = st.number_input(f'Page (of {num_pages})', min_value=1, max_value=num_pages, step=1, key='review_page')
+
+    start = (page - 1) * page_size
     st.write(f'Displaying {len(filtered_df)} reviews') # showing 98
     col1, col2 = st.columns([4, 1])
     with col1:
-        st.markdown(":red[(Double click to see the full description of each rating)]")
+        st.markdown(":red[(Select a row to see the full description of its review)]")
     with col2:
         adjustable_table = st.checkbox('Adjustable table')
     if adjustable_table:
         values = st.slider(":red[Drag slider to adjust width of dataframe]", 200, 1000, 600)
-    filtered_df = filtered_df.reset_index(drop=True)
-    st.dataframe(filtered_df[['month_year', 'ReviewDescription', 'StarRating']], use_container_width=True, width=values if adjustable_table else None)
+
+    with span('review_page'):
+        order_key = (dataset.version, restaurant, (show_empty_reviews, current_filter_state()))
+        page_df = sort_reviews(filtered_df, sort, start, start + page_size, order_key).reset_index(drop=True)
+        descriptions = page_df['ReviewDescription']
+        previews = descriptions.str.slice(0, REVIEW_PREVIEW_CHARS)
+        previews = previews.where(descriptions.str.len() <= REVIEW_PREVIEW_CHARS, previews + '…')
+        table_df = pd.DataFrame({
+            'month_year': page_df['month_year'].dt.strftime('%b-%Y'),
+            'ReviewDescription': previews,
+            'StarRating': page_df['StarRating'],
+        })
+    metrics.observe('payload_bytes', int(table_df.memory_usage(deep=True).sum()), BYTES_BUCKETS, kind='review_page')
+    # The selection belongs to the rows on screen, so it is cleared when another page or order is shown
+    event = st.dataframe(
+        table_df,
+        use_container_width=True,
+        width=values if adjustable_table else None,
+        on_select='rerun',
+        selection_mode='single-row',
+        key=f'review_table_{sort}_{page_size}_{page}',
+    )
+    selected_rows = [row for row in event.selection.rows if row < len(page_df)]
+    if selected_rows:
+        review = page_df.iloc[selected_rows[0]]
+        st.markdown(f"**{review['StarRating']} ★, {review['DateOfReview']:%d %b %Y}**")
+        st.write(review['ReviewDescription'])
 
 def initialize_session_state():
     if 'status' not in st.session_state:
         st.session_state.status = 'Ready'
     if 'last_modified_time' not in st.session_state:
         st.session_state.last_modified_time = datetime.min.replace(tzinfo=pytz.UTC).astimezone(pytz.timezone('Asia/Singapore'))
-    if 'restaurant_names' not in st.session_state:
-        st.session_state.restaurant_names = []
-    if 'reviews_df' not in st.session_state:
-        st.session_state.reviews_df = {}
-    if 'summary_dict' not in st.session_state:
-        st.session_state.summary_dict = {}
-    if 'ngrams_dict' not in st.session_state:
-        st.session_state.ngrams_dict = {}
-    if 'last_modified_dict' not in st.session_state:
-        st.session_state.last_modified_dict = {}
+    if 'dataset_version' not in st.session_state:
+        st.session_state.dataset_version = None
     if 'request_id' not in st.session_state:
         st.session_state.request_id = None
+    if 'summary_job' not in st.session_state:
+        st.session_state.summary_job = None
+    if 'session_id' not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
     if 'refresh_interval' not in st.session_state:
         st.session_state.refresh_interval = 300000  # Default to 5 minutes
 
-def filter_dataframe(df: pd.DataFrame) -> pd.DataFrame:
-    # Try to convert datetimes into a standard format (datetime, no timezone)
-    for col in df.columns:
-        if is_object_dtype(df[col]):
-            try:
-                df[col] = pd.to_datetime(df[col])
-                logger.debug(col)
-            except Exception:
-                pass
+def compute_filter_bitmap(dataset, restaurant, column, value):
+    """Return a bitmap over the rows of the restaurant frame, True for the rows kept by one filter."""
+    reviews, _, _ = get_restaurant_data(dataset, bucket_name, restaurant)
+    kind = FILTER_SCHEMA[column]['kind']
+    if kind == 'text':
+        return search_reviews(get_text_index(dataset, bucket_name, restaurant), reviews, value)
+    if kind == 'range':
+        values = reviews[column].to_numpy()
+        return (values >= value[0]) & (values <= value[1])
+    if kind == 'month_range':
+        # The frame is sorted by date, newest first, so the selected months are one contiguous block of rows
+        sort_keys = -reviews[column].array.asi8
+        start = np.searchsorted(sort_keys, -pd.Period(value[1], 'M').ordinal, side='left')
+        end = np.searchsorted(sort_keys, -pd.Period(value[0], 'M').ordinal, side='right')
+        bitmap = np.zeros(len(reviews), dtype=bool)
+        bitmap[start:end] = True
+        return bitmap
+    raise ValueError(f'Unknown filter kind: {kind}')
+
+@st.cache_resource(max_entries=FILTER_CACHE_SIZE)
+def get_column_bitmap(dataset_version, restaurant, column, value, _dataset):
+    bitmap = compute_filter_bitmap(_dataset, restaurant, column, value)
+    bitmap.flags.writeable = False
+    return bitmap
+
+@st.cache_resource(max_entries=FILTER_CACHE_SIZE)
+def get_filter_bitmap(dataset_version, restaurant, filter_state, _dataset):
+    metrics.inc('cache_misses_total', cache='filter_bitmap')
+    # Each filter is memoized on its own, so changing one filter only recomputes that filter and the intersection
+    bitmaps = [get_column_bitmap(dataset_version, restaurant, column, value, _dataset) for column, value in filter_state]
+    bitmap = np.logical_and.reduce(bitmaps)
+    bitmap.flags.writeable = False
+    return bitmap
+
+def filter_widget_keys(column):
+    if FILTER_SCHEMA[column]['kind'] == 'month_range':
+        return [f'filter_{column}_start', f'filter_{column}_end']
+    return [f'filter_{column}']
+
+def display_filter_widget(column, reviews):
+    """Display the widget of one filter, and return its value, or None when it does not filter anything."""
+    spec = FILTER_SCHEMA[column]
+    _, right = st.columns((1, 20))
+    if spec['kind'] == 'text':
+        query = right.text_input(spec['label'], key=f'filter_{column}', placeholder=spec['placeholder'])
+        return query.strip() or None
+
+    if spec['kind'] == 'range':
+        min_value, max_value = spec['bounds']
+        user_num_input = right.slider(
+            spec['label'],
+            min_value=min_value,
+            max_value=max_value,
+            value=(min_value, max_value),
+            step=1,
+            key=f'filter_{column}',
+        )
+        return None if user_num_input == (min_value, max_value) else tuple(user_num_input)
+
+    if spec['kind'] == 'month_range':
+        # Newest first in the frame, so reverse to list the months in order
+        unique_month_years = list(reviews[column].unique()[::-1])
+        start_key, end_key = filter_widget_keys(column)
+        with right:
+            col1, col2 = st.columns(2)
+            with col1:
+                start_date = st.selectbox("Start date", unique_month_years, index=0, format_func=str, key=start_key)
+            with col2:
+                end_date = st.selectbox("End date", unique_month_years, index=len(unique_month_years) - 1, format_func=str, key=end_key)
+        if start_date > end_date:
+            st.error("Start date must be before or equal to end date")
+            return None
+        if (start_date, end_date) == (unique_month_years[0], unique_month_years[-1]):
+            return None
+        return (str(start_date), str(end_date))
 
-        if is_datetime64_any_dtype(df[col]):
-            df[col] = df[col].dt.tz_localize(None)
+    raise ValueError(f"Unknown filter kind: {spec['kind']}")
 
-    cols_to_filter = ['StarRating', 'month_year']
+def current_filter_state():
+    return tuple((column, value) for column, value in st.session_state.filters.items() if value is not None)
 
+def filter_dataframe(df: pd.DataFrame, dataset: Dataset, restaurant: str) -> pd.DataFrame:
     # Initialize session state for filters
     if 'filters' not in st.session_state:
-        st.session_state.filters = {col: None for col in cols_to_filter}
+        st.session_state.filters = {column: None for column in FILTER_SCHEMA}
 
     col1, col2 = st.columns((5,1))
     with col1:
@@ -220,125 +1377,173 @@ def filter_dataframe(df: pd.DataFrame) -> pd.DataFrame:
         reset_button = st.button(':red[Reset filters]')
 
     if reset_button:
-        st.session_state.filters = {col: None for col in cols_to_filter}
-
-    modification_container = st.expander("Filters", expanded=False)
+        st.session_state.filters = {column: None for column in FILTER_SCHEMA}
+        for column in FILTER_SCHEMA:
+            for key in filter_widget_keys(column):
+                st.session_state.pop(key, None)
 
-    
-    with modification_container:
-    # Handle 'StarRating' column
-        if 'StarRating' in cols_to_filter:
-            _, right = st.columns((1, 20))
-            
-            # Set fixed min and max values for StarRating
-            min_value = 1
-            max_value = 5
-            
-            # Retrieve or set default slider values
-            default_values = st.session_state.filters.get('StarRating', (min_value, max_value))
-            
-            # Ensure default_values is a tuple (min_value, max_value)
-            if not isinstance(default_values, tuple):
-                default_values = (min_value, max_value)
-
-            user_num_input = right.slider(
-                "Filter Star Rating",
-                min_value=min_value,
-                max_value=max_value,
-                value=default_values,
-                step=1,
-            )
-            # Ensure the output is a tuple
-            if isinstance(user_num_input, int):
-                user_num_input = (user_num_input, user_num_input)
-
-            st.session_state.filters['StarRating'] = user_num_input
-            
-            # Apply the filter
-            df = df[df['StarRating'].between(*user_num_input)]
-
-            # Check if the filtered DataFrame is empty
-            if df.empty:
-                st.warning("No results found for the selected Star Rating.")
-                st.stop()
-
-        # Handle 'month_year' column
-        if 'month_year' in cols_to_filter:
-            left, right = st.columns((1, 20))
-            
-            # Convert datetime column to month-year format
-            df['MonthYear'] = df['month_year'].dt.to_period('M').astype(str)
-            
-            # Get unique sorted month-year values
-            unique_month_years = sorted(df['MonthYear'].unique())
-            
-            # Retrieve or set default start and end dates
-            # default_values = st.session_state.filters.get('month_year', (unique_month_years[0], unique_month_years[-1]))
-
-            # if not isinstance(default_values, tuple) or default_values is None:
-            default_values = (unique_month_years[0], unique_month_years[-1])
-            
-            default_start, default_end = default_values
-            
-            if default_start not in unique_month_years:
-                default_start = unique_month_years[0]
-                
-            if default_end not in unique_month_years:
-                default_end = unique_month_years[-1]
-            
-            # Display selection boxes for date range
-            col1, col2 = st.columns(2)
-            with col1:
-                start_date_str = st.selectbox("Start date", unique_month_years, index=unique_month_years.index(default_start))
-            with col2:
-                end_date_str = st.selectbox("End date", unique_month_years, index=unique_month_years.index(default_end))
-            
-            # Convert selected month-year strings back to datetime objects for filtering
-            start_date = pd.to_datetime(start_date_str, format='%Y-%m')
-            end_date = pd.to_datetime(end_date_str, format='%Y-%m') + pd.offsets.MonthEnd(1)
-            
-            # Validate and apply the date range filter
-            if start_date > end_date:
-                st.error("Start date must be before or equal to end date")
-            else:
-                st.session_state.filters['month_year'] = (start_date_str, end_date_str)
-                df = df.loc[df['month_year'].between(start_date, end_date)]
+    reviews, _, _ = get_restaurant_data(dataset, bucket_name, restaurant)
+    with st.expander("Filters", expanded=False):
+        st.session_state.filters = {column: display_filter_widget(column, reviews) for column in FILTER_SCHEMA}
 
-                # Check if the filtered DataFrame is empty
-                if df.empty:
-                    st.warning("No results found for the selected date range.")
-                    st.stop()
+    filter_state = current_filter_state()
+    if filter_state:
+        # Bitmap over the rows of the whole restaurant frame, indexed by the row labels of df
+        with span('filter'):
+            metrics.inc('cache_lookups_total', cache='filter_bitmap')
+            bitmap = get_filter_bitmap(dataset.version, restaurant, filter_state, dataset)
+            df = df[bitmap[df.index.to_numpy()]]
 
-            # Convert 'month_year' to desired string format for display
-            df['month_year'] = df['month_year'].dt.strftime('%b-%Y')
+    if df.empty:
+        st.warning("No reviews found for the selected filters.")
 
     return df
     
+def build_monthly_rollup(dataset, restaurants):
+    """Stack the chart rollups of the given restaurants into one frame of (restaurant, month, sum, count) rows.
+
+    The restaurants without a rollup are read in batches of COMPARE_LOAD_BATCH, and only their rollups
+    are kept, so comparing every restaurant does not keep every frame in memory.
+    """
+    missing = [restaurant for restaurant in restaurants if restaurant not in dataset.chart_rollups]
+    unloaded = [restaurant for restaurant in missing if restaurant not in dataset.frames]
+    for restaurant in missing:
+        if restaurant in dataset.frames:
+            get_chart_rollup(dataset, bucket_name, restaurant)
+    # The legacy file holds every restaurant, so its restaurants are read in one batch
+    legacy = [restaurant for restaurant in unloaded if dataset.index[restaurant]['key'] is None]
+    sharded = [restaurant for restaurant in unloaded if dataset.index[restaurant]['key'] is not None]
+    batches = [legacy] if legacy else []
+    batches += [sharded[i:i + COMPARE_LOAD_BATCH] for i in range(0, len(sharded), COMPARE_LOAD_BATCH)]
+    for batch in batches:
+        # The lock is released between batches, so other sessions can still load the restaurant they selected
+        with dataset.load_lock:
+            batch = [restaurant for restaurant in batch if restaurant not in dataset.chart_rollups]
+            for restaurant, (reviews, _, _) in read_frames(dataset, bucket_name, batch).items():
+                dataset.chart_rollups[restaurant] = build_chart_rollup(reviews)
+    if unloaded:
+        logger.info(f'Chart rollups for {len(unloaded)} restaurant(s) built without loading their frames')
+
+    rollups = [dataset.chart_rollups[restaurant] for restaurant in restaurants]
+    lengths = [len(rollup.months) for rollup in rollups]
+    return pd.DataFrame({
+        'restaurant': pd.Categorical.from_codes(np.repeat(np.arange(len(restaurants)), lengths), categories=restaurants),
+        'month': pd.PeriodIndex.from_ordinals(
+            np.concatenate([rollup.months.asi8 for rollup in rollups] + [np.array([], dtype=np.int64)]), freq='M'
+        ),
+        'sum': np.concatenate([rollup.monthly_sum.sum(axis=0) for rollup in rollups] + [np.array([])]),
+        'count': np.concatenate([rollup.monthly_count.sum(axis=0) for rollup in rollups] + [np.array([], dtype=np.int64)]),
+    })
+
+@st.cache_resource(max_entries=2)
+def get_monthly_rollup(dataset_version, _dataset):
+    # Built once per dataset version. The rollups of unchanged restaurants are carried over to the next version,
+    # so only the changed restaurants are read again
+    metrics.inc('cache_misses_total', cache='monthly_rollup')
+    rollup = build_monthly_rollup(_dataset, list(_dataset.index))
+    logger.info(f'Monthly rollup for dataset v{dataset_version} built ({len(rollup)} rows)')
+    return rollup
+
+def rank_restaurants(rollup, restaurants, start, end, rank_by, min_reviews):
+    """Return the average rating and number of reviews of each restaurant in the months start to end, best first."""
+    window = rollup[rollup['restaurant'].isin(restaurants) & (rollup['month'] >= start) & (rollup['month'] <= end)]
+    totals = window.groupby('restaurant', observed=True)[['sum', 'count']].sum()
+    ranking = pd.DataFrame({
+        'Average Rating': (totals['sum'] / totals['count']).round(2),
+        'Reviews': totals['count'].astype('int64'),
+    })
+    ranking = ranking[ranking['Reviews'] >= min_reviews]
+    by = ['Average Rating', 'Reviews'] if rank_by == 'Average rating' else ['Reviews', 'Average Rating']
+    ranking = ranking.sort_values(by=by, ascending=False)
+    ranking.index = ranking.index.astype(str)
+    ranking.index.name = 'Restaurant'
+    return ranking
+
+def display_comparison(dataset, restaurants):
+    st.subheader('Compare restaurants')
+    st.write('Restaurants matching the search in the sidebar are ranked side by side.')
+    if not restaurants:
+        st.warning('No restaurants to compare.')
+        return
+
+    with span('comparison'):
+        metrics.inc('cache_lookups_total', cache='monthly_rollup')
+        rollup = get_monthly_rollup(dataset.version, dataset)
+        months = sorted(rollup.loc[rollup['restaurant'].isin(restaurants), 'month'].unique())
+    if not months:
+        st.warning('No reviews to compare.')
+        return
+
+    month_labels = [str(month) for month in months]
+    start, end = st.select_slider(
+        'Months',
+        options=month_labels,
+        value=(month_labels[0], month_labels[-1]),
+        format_func=lambda label: pd.Period(label, 'M').strftime('%b-%Y'),
+    )
+    col1, col2 = st.columns(2)
+    with col1:
+        rank_by = st.selectbox('Rank by', ['Average rating', 'Number of reviews'])
+    with col2:
+        min_reviews = st.number_input('Least number of reviews', min_value=1, value=COMPARE_MIN_REVIEWS, step=1)
+
+    with span('comparison'):
+        ranking = rank_restaurants(rollup, restaurants, pd.Period(start, 'M'), pd.Period(end, 'M'), rank_by, min_reviews)
+    st.write(f'Ranking {len(ranking)} of {len(restaurants)} restaurants')
+    st.dataframe(ranking, use_container_width=True)
+
+    trend_restaurants = st.multiselect(
+        'Monthly trend of',
+        list(ranking.index),
+        default=list(ranking.index[:COMPARE_TREND_LIMIT]),
+    )
+    if trend_restaurants:
+        window = rollup[
+            rollup['restaurant'].isin(trend_restaurants)
+            & (rollup['month'] >= pd.Period(start, 'M')) & (rollup['month'] <= pd.Period(end, 'M'))
+        ]
+        monthlyGroupedDf = pd.DataFrame({
+            'Restaurant': window['restaurant'].astype(str),
+            'Date': window['month'].dt.to_timestamp(),
+            'Star Rating': (window['sum'] / window['count']).round(2),
+            'Num_Reviews': window['count'],
+        })
+        line_chart = alt.Chart(monthlyGroupedDf).mark_line(point=True).encode(
+            x=alt.X('Date:T', title='Date [Month]'),
+            y=alt.Y('Star Rating:Q', title='Average Star Rating'),
+            color=alt.Color('Restaurant:N', legend=alt.Legend(orient='bottom', columns=2)),
+            tooltip=['Restaurant:N', 'Date:T', 'Star Rating:Q', 'Num_Reviews:Q']
+        ).properties(height=300)
+        st.altair_chart(line_chart, use_container_width=True)
+
+def display_debug_panel(started_at):
+    # Timings of this rerun so far, and the metrics of the whole process
+    with st.sidebar.expander('Debug', expanded=True):
+        st.write(f'Rerun: {(time.perf_counter() - started_at) * 1000:.1f} ms')
+        spans = pd.DataFrame(list(rerun_spans), columns=['stage', 'seconds'])
+        stages = spans.groupby('stage', sort=False)['seconds'].agg(['count', 'sum'])
+        stages['ms'] = (stages.pop('sum') * 1000).round(1)
+        st.dataframe(stages, use_container_width=True)
+        if st.checkbox('Show metrics'):
+            st.code(metrics.render(), language='text')
+
 def main():
+    started_at = time.perf_counter()
     initialize_session_state()
+    metrics.inc('reruns_total')
+    metrics.session_seen(st.session_state.session_id)
 
-    updated_time = check_for_updates(bucket_name, json_file_name)
-    if st.session_state.last_modified_time.tzinfo is None:
-        st.session_state.last_modified_time = st.session_state.last_modified_time.replace(tzinfo=pytz.UTC)
-    st.session_state.last_modified_time = st.session_state.last_modified_time.astimezone(pytz.timezone('Asia/Singapore'))
+    with span('refresh'):
+        dataset = refresh_data(bucket_name, manifest_file_name, json_file_name)
+    if st.session_state.dataset_version != dataset.version:
+        logger.info(f'Session moved from dataset v{st.session_state.dataset_version} to v{dataset.version}')
+        st.session_state.dataset_version = dataset.version
+    st.session_state.last_modified_time = dataset.updated_time
     logger.info(f'Cached DB last modified date: {st.session_state.last_modified_time}')
 
-    if updated_time > st.session_state.last_modified_time:
-        restaurant_names, reviews_df, summary_dict, ngrams_dict, last_modified_dict = load_and_process_data(bucket_name, json_file_name, bypass_cache=True)
-        st.session_state.restaurant_names = restaurant_names
-        st.session_state.reviews_df = reviews_df
-        st.session_state.summary_dict = summary_dict
-        st.session_state.ngrams_dict = ngrams_dict
-        st.session_state.last_modified_time = updated_time
-        st.session_state.last_modified_dict = last_modified_dict
-        logger.info(f'Updated DB last modified time: {st.session_state.last_modified_time}')
-    else:
-        restaurant_names = st.session_state.restaurant_names
-        reviews_df = st.session_state.reviews_df
-        summary_dict = st.session_state.summary_dict
-        ngrams_dict = st.session_state.ngrams_dict
-        last_modified_dict = st.session_state.last_modified_dict
-        
+    restaurant_names = list(dataset.index.keys())
+    last_modified_dict = {restaurant: entry['last_modified'] for restaurant, entry in dataset.index.items()}
+
     st.sidebar.title('Search for your restaurant from the list below.')
     st.sidebar.subheader(':blue[If your desired restaurant is not found, there will be an option to extract the reviews.]')
     st.sidebar.divider()
@@ -346,18 +1551,20 @@ def main():
     if st.session_state.status:
         if st.session_state.status == 'Completed':
             st.sidebar.subheader(f':large_green_circle: Scraping request for {st.session_state.res_name} has completed, please refresh page!')
-            st.cache_data.clear()
+            refresh_data(bucket_name, manifest_file_name, json_file_name, force=True)
             st.session_state.request_id = None
             st.session_state.status = 'Ready'
-            st.session_state.refresh_interval = 300000  # Reset to 5 minutes
         elif 'Failed' in st.session_state.status:
             st.sidebar.subheader(f':large_orange_circle: Scraping request for {st.session_state.res_name} has failed. Please try again with a different name')
             st.session_state.request_id = None
             st.session_state.status = 'Ready'
-            st.session_state.refresh_interval = 300000  # Reset to 5 minutes
         elif 'In Progress' in st.session_state.status:
             st.sidebar.subheader(f':large_yellow_circle: Scraping request for {st.session_state.res_name} sent! Please check back later!')
 
+    if st.session_state.request_id:
+        get_status_watcher().watch(st.session_state.request_id)
+        watch_request_status()
+
     with st.sidebar:
         search_term = st_keyup("Search for the name of your restaurant here", key="0")
         st.session_state.search_term = search_term
@@ -366,17 +1573,22 @@ def main():
         st.session_state.filtered_restaurant_names = restaurant_names
 
     if st.session_state.search_term:
-        st.session_state.filtered_restaurant_names = [name for name in restaurant_names if st.session_state.search_term.lower() in name.lower()]
+        with span('name_search'):
+            metrics.inc('cache_lookups_total', cache='name_index')
+            name_index = get_name_index(dataset.version, restaurant_names)
+            st.session_state.filtered_restaurant_names = search_names(name_index, st.session_state.search_term)
     else:
         st.session_state.filtered_restaurant_names = restaurant_names
 
-    st_autorefresh(interval=st.session_state.refresh_interval, key="poll_status")
+    st_autorefresh(interval=st.session_state.refresh_interval, key="refresh_data")
     selected_restaurant = st.sidebar.selectbox('Or select one from the list below:', st.session_state.filtered_restaurant_names)
+    compare_view = st.sidebar.toggle('Compare restaurants', help='Rank the restaurants matching the search side by side')
 
     logger.info(f'Status: {st.session_state.status}')
-    poll_status()
 
-    if selected_restaurant not in restaurant_names:
+    if compare_view:
+        display_comparison(dataset, st.session_state.filtered_restaurant_names)
+    elif selected_restaurant not in restaurant_names:
         st.subheader(':red[Restaurant not found!]')
         st.write('Please try a different name. If the restaurant cannot be found from the list, you can request for it. (Will take up to 5 minutes, depending on the amount of reviews)')
 
@@ -388,11 +1600,14 @@ def main():
         if generate_new_data:
             st.session_state.res_name = res_name
             st.session_state.request_id = send_scraping_request(res_name, loc_name, review_limit)
-            st.session_state.refresh_interval = 10000  # Set to 10 seconds
-            logger.info(f'Scrape initiated. Request ID: {st.session_state.request_id}')
-            poll_status()
-            st.rerun()
-            # st.session_state.status = 'In Progress'
+            if st.session_state.request_id is None:
+                st.error('Could not send the scraping request, please try again later.')
+            else:
+                logger.info(f'Scrape initiated. Request ID: {st.session_state.request_id}')
+                # The first status arrives in the background, until then the request is shown as in progress
+                st.session_state.status = 'In Progress'
+                get_status_watcher().watch(st.session_state.request_id)
+                st.rerun()
 
         selected_df = pd.DataFrame(columns=['DateOfReview', 'StarRating', 'month_year', 'ReviewDescription'])
     else:
@@ -407,7 +1622,7 @@ def main():
         #     remove_review_button = st.button(':red[DELETE INFORMATION FOR THIS RESTAURANT]')
         #     if remove_review_button:
         #         remove_review(selected_restaurant)
-        #         restaurant_names, reviews_df, summary_dict, ngrams_dict, last_modified_dict = load_and_process_data(bucket_name, json_file_name, bypass_cache=True)
+        #         refresh_data(bucket_name, manifest_file_name, json_file_name, force=True)
         #         st.session_state.filtered_restaurant_names = restaurant_names
         #         st.rerun()
         
@@ -426,24 +1641,38 @@ def main():
             # st.write('2-gram')
             # display_wordcloud(ngrams['twogram'])
 
-        selected_df = reviews_df[selected_restaurant]
-        selected_df['DateOfReview'] = pd.to_datetime(selected_df['DateOfReview'], format='%Y-%m-%d')
-        selected_df = selected_df.sort_values(by='DateOfReview', ascending=False)
-        selected_df['StarRating'] = pd.to_numeric(selected_df['StarRating'])
-        selected_df['month_year'] = selected_df['DateOfReview'].dt.to_period('M').dt.to_timestamp().dt.strftime('%b-%Y')
-        selected_df['DateOfReview'] = selected_df['DateOfReview'].dt.date
-        selected_df = selected_df.reset_index(drop=True)
-        filtered_df = display_charts(selected_df)
+        selected_df, summary_info, ngrams = get_restaurant_data(dataset, bucket_name, selected_restaurant)
+        filtered_df, show_empty_reviews = display_charts(selected_df, dataset, selected_restaurant)
 
-        analyze_review_button = st.button(':green[Generate AI Summary of Review]')
-        
-        if analyze_review_button:
-            analyze_reviews(selected_restaurant, selected_df[['ReviewDescription', 'StarRating']])
-            restaurant_names, reviews_df, summary_dict, ngrams_dict, last_modified_dict = load_and_process_data(bucket_name, json_file_name, bypass_cache=True)
-        
-        summary = summary_dict[selected_restaurant]['summary']
-        pros = summary_dict[selected_restaurant]['pros']
-        cons = summary_dict[selected_restaurant]['cons']
+        summary_job = get_summary_job(selected_restaurant)
+        if summary_job is not None and not summary_job.done():
+            watch_summary_job(selected_restaurant)
+        else:
+            if summary_job is not None and st.session_state.summary_job == selected_restaurant:
+                # Shown once, to the session that asked for the summary
+                st.session_state.summary_job = None
+                # Any error the job did not handle is reported as a failed summary, not raised on this page
+                if summary_job.exception() is not None:
+                    logger.error(f'Summary job for {selected_restaurant} failed: {summary_job.exception()!r}')
+                    result = 'failed'
+                else:
+                    result = summary_job.result()
+                if result == 'updated':
+                    st.success('AI summary updated')
+                elif result == 'up to date':
+                    st.info('AI summary already up to date, there are no new reviews since the last one')
+                else:
+                    st.error('Failed to generate the AI summary, please try again')
+            analyze_review_button = st.button(':green[Generate AI Summary of Review]')
+            if analyze_review_button:
+                # Runs in the background, and only this restaurant's summary is merged into the dataset when it is done
+                start_summary_job(selected_restaurant, selected_df[['ReviewDescription', 'StarRating']])
+                st.session_state.summary_job = selected_restaurant
+                st.rerun()
+
+        summary = summary_info['summary']
+        pros = summary_info['pros']
+        cons = summary_info['cons']
 
         logger.info(f"Summary: {summary}")
         logger.info(f"Pros: {pros}")
@@ -463,7 +1692,10 @@ def main():
             st.subheader(f"What they dislike about {selected_restaurant}:")
             st.write(cons)
         
-        display_reviews_df(filtered_df)
+        display_reviews_df(filtered_df, dataset, selected_restaurant, show_empty_reviews)
+
+    if DEBUG_PANEL == 'on' or (DEBUG_PANEL == 'url' and st.query_params.get('debug') == '1'):
+        display_debug_panel(started_at)
 
 if __name__ == "__main__":
     main()
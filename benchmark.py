@@ -0,0 +1,277 @@
+"""Benchmark the data paths of the dashboard on synthetic data, without Streamlit or AWS.
+
+Generates reviews in the same shape as the S3 data, serves them from an in-memory S3 stand-in,
+and times the ingest, filter, chart and search paths of app.py. Peak memory is measured with
+tracemalloc, which sees Python and numpy allocations but not the Arrow buffers of the review text.
+
+    python benchmark.py --restaurants 200 --reviews 2000 --description-length 300
+    python benchmark.py --layout sharded --json results.json
+"""
+import argparse
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import pytz
+
+BUCKET_NAME = 'benchmark'
+JSON_FILE_NAME = 'reviews.json'
+MANIFEST_FILE_NAME = 'manifest.json'
+WORDS = (
+    'food service staff friendly slow fast price cheap expensive parking clean dirty noodles rice chicken '
+    'coffee dessert portion spicy fresh queue wait table ambience music recommend again never great bad'
+).split()
+
+def generate_reviews(num_reviews, description_length, rng):
+    start = datetime(2021, 1, 1)
+    reviews = []
+    for _ in range(num_reviews):
+        if rng.random() < 0.2:
+            description = 'nil'
+        else:
+            words = []
+            while sum(len(word) + 1 for word in words) < description_length:
+                words.append(rng.choice(WORDS))
+            description = ' '.join(words).capitalize() + '.'
+        reviews.append({
+            'DateOfReview': (start + timedelta(days=rng.randrange(3 * 365))).strftime('%Y-%m-%d'),
+            'StarRating': str(rng.randint(1, 5)),
+            'ReviewDescription': description,
+        })
+    return reviews
+
+def generate_data(num_restaurants, num_reviews, description_length, seed):
+    """Return synthetic data in the {restaurant: {data, summary, ngram, last_modified}} shape of the legacy file."""
+    rng = random.Random(seed)
+    return {
+        f'Restaurant {i} - Branch {i % 7}': {
+            'data': generate_reviews(num_reviews, description_length, rng),
+            'summary': {'summary': 'Synthetic summary.', 'pros': 'Synthetic pros.', 'cons': 'Synthetic cons.'},
+            'ngram': {'onegram': {}, 'twogram': {}},
+            'last_modified': {'scrape': '2024-07-01', 'summary': ''},
+        }
+        for i in range(num_restaurants)
+    }
+
+class LocalS3:
+    """In-memory stand-in for the parts of the boto3 S3 client used by app.py."""
+
+    def __init__(self):
+        self.objects = {}
+        self.bytes_read = 0
+
+    def put_object(self, Bucket, Key, Body):
+        body = Body if isinstance(Body, bytes) else Body.encode('utf-8')
+        self.objects[(Bucket, Key)] = (body, f'"{hash(body):x}"', datetime.now(pytz.UTC))
+
+    def get_object(self, Bucket, Key, IfNoneMatch=None):
+        from botocore.exceptions import ClientError
+
+        if (Bucket, Key) not in self.objects:
+            raise ClientError({'Error': {'Code': 'NoSuchKey'}, 'ResponseMetadata': {'HTTPStatusCode': 404}}, 'GetObject')
+        body, etag, last_modified = self.objects[(Bucket, Key)]
+        if IfNoneMatch == etag:
+            raise ClientError({'Error': {'Code': '304'}, 'ResponseMetadata': {'HTTPStatusCode': 304}}, 'GetObject')
+        self.bytes_read += len(body)
+        return {'Body': io.BytesIO(body), 'ETag': etag, 'LastModified': last_modified}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop((Bucket, Key), None)
+
+def upload(s3, data, layout):
+    if layout == 'legacy':
+        s3.put_object(BUCKET_NAME, JSON_FILE_NAME, json.dumps(data))
+        return
+    restaurants = {}
+    for restaurant, restaurant_info in data.items():
+        key = f'restaurants/{restaurant}.json'
+        s3.put_object(BUCKET_NAME, key, json.dumps(restaurant_info))
+        restaurants[restaurant] = {'key': key, 'last_modified': restaurant_info['last_modified']}
+    s3.put_object(BUCKET_NAME, MANIFEST_FILE_NAME, json.dumps({'restaurants': restaurants}))
+
+def import_app(s3, snapshot_dir, project_dir):
+    """Import app.py against the S3 stand-in, with secrets written to project_dir."""
+    secrets = {
+        'AWS_ACCESS_KEY_ID': 'benchmark',
+        'AWS_SECRET_ACCESS_KEY': 'benchmark',
+        'AWS_DEFAULT_REGION': 'ap-southeast-1',
+        'S3_BUCKET_NAME': BUCKET_NAME,
+        'S3_JSON_NAME': JSON_FILE_NAME,
+        'S3_MANIFEST_NAME': MANIFEST_FILE_NAME,
+        'FLASK_APP_URL': 'http://127.0.0.1:9',
+        'SNAPSHOT_DIR': snapshot_dir,
+    }
+    os.makedirs(os.path.join(project_dir, '.streamlit'))
+    with open(os.path.join(project_dir, '.streamlit', 'secrets.toml'), 'w', encoding='utf-8') as f:
+        f.writelines(f'{key} = {json.dumps(value)}\n' for key, value in secrets.items())
+
+    # Streamlit finds the project secrets relative to the working directory. app.py reads them all when it is
+    # imported, so the working directory is restored right after
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    cwd = os.getcwd()
+    os.chdir(project_dir)
+    try:
+        import boto3
+        boto3.client = lambda *args, **kwargs: s3
+        import app
+    finally:
+        os.chdir(cwd)
+    return app
+
+def measure(name, func, repeat):
+    """Run func repeat times, and return its median time and the peak memory of the first run."""
+    tracemalloc.start()
+    result = func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return {'name': name, 'seconds': statistics.median(times), 'peak_mb': peak / 1e6}, result
+
+def run(args):
+    # The snapshots can be large, so they are removed with the secrets once the benchmark is done
+    with tempfile.TemporaryDirectory(prefix='review-dashboard-snapshot-') as snapshot_dir, \
+            tempfile.TemporaryDirectory(prefix='review-dashboard-benchmark-') as project_dir:
+        return run_benchmark(args, snapshot_dir, project_dir)
+
+def run_benchmark(args, snapshot_dir, project_dir):
+    data = generate_data(args.restaurants, args.reviews, args.description_length, args.seed)
+    s3 = LocalS3()
+    upload(s3, data, args.layout)
+    del data
+
+    app = import_app(s3, snapshot_dir, project_dir)
+    import logging
+    logging.getLogger(app.__name__).setLevel(logging.WARNING)
+
+    # Streamlit caches do not apply outside the Streamlit runtime, so get_data_store would return a new,
+    # empty store on every call. Each simulated process creates one store and pins it for the app
+    new_data_store = app.get_data_store
+
+    def fresh_dataset(from_snapshot=False):
+        # A new process: a new data store, and no snapshot on disk unless from_snapshot
+        if not from_snapshot:
+            for name in os.listdir(snapshot_dir):
+                path = os.path.join(snapshot_dir, name)
+                if os.path.isfile(path):
+                    os.remove(path)
+        store = new_data_store()
+        app.get_data_store = lambda: store
+        return app.refresh_data(BUCKET_NAME, MANIFEST_FILE_NAME, JSON_FILE_NAME)
+
+    def ingest(from_snapshot=False):
+        dataset = fresh_dataset(from_snapshot)
+        app.load_restaurants(dataset, BUCKET_NAME, list(dataset.index))
+        return dataset
+
+    def compare(from_snapshot=False):
+        dataset = fresh_dataset(from_snapshot)
+        return app.build_monthly_rollup(dataset, list(dataset.index))
+
+    results = []
+    result, _ = measure('ingest, cold (S3 download + build, all restaurants)', ingest, args.repeat)
+    results.append(result)
+    result, _ = measure('comparison, cold (S3 download + rollups only)', compare, args.repeat)
+    results.append(result)
+    result, monthly_rollup = measure('comparison, restart (rollups from snapshots)', lambda: compare(from_snapshot=True), args.repeat)
+    results.append(result)
+    result, dataset = measure('ingest, restart (frames from snapshots)', lambda: ingest(from_snapshot=True), args.repeat)
+    results.append(result)
+    # The last ingest left its store pinned, so the refresh only sends a conditional GET for the unchanged data file
+    result, _ = measure(
+        'refresh, data unchanged (304 Not Modified)',
+        lambda: app.refresh_data(BUCKET_NAME, MANIFEST_FILE_NAME, JSON_FILE_NAME, force=True),
+        args.repeat,
+    )
+    results.append(result)
+    dataset = app.get_data_store()['dataset']
+
+    # The filter and chart paths are timed on the largest restaurant. Their Streamlit caches do not apply here,
+    # so every call is a build
+    restaurant = max(dataset.index, key=lambda name: len(app.get_restaurant_data(dataset, BUCKET_NAME, name)[0]))
+    reviews, _, _ = app.get_restaurant_data(dataset, BUCKET_NAME, restaurant)
+    months = reviews['month_year']
+    month_range = (str(months.min() + 3), str(months.max() - 3))
+
+    def filter_paths():
+        dataset.text_indexes.pop(restaurant, None)
+        return [
+            app.compute_filter_bitmap(dataset, restaurant, 'ReviewDescription', 'friendly staff'),
+            app.compute_filter_bitmap(dataset, restaurant, 'StarRating', (2, 4)),
+            app.compute_filter_bitmap(dataset, restaurant, 'month_year', month_range),
+        ]
+
+    def chart_paths():
+        dataset.chart_rollups.pop(restaurant, None)
+        return app.get_charts(dataset.version, restaurant, False, dataset)
+
+    checks = [
+        ('text index build', lambda: app.build_text_index(reviews)),
+        ('filters (text + rating + months, index included)', filter_paths),
+        ('text search (indexed)', lambda: app.search_reviews(dataset.text_indexes[restaurant], reviews, '"friendly staff" parking')),
+        ('chart rollup + specs', chart_paths),
+        ('page sort (lowest rating, order not memoized)', lambda: app.sort_reviews(reviews, 'Lowest rating', 0, 100)),
+        ('name index build', lambda: app.build_name_index(list(dataset.index))),
+    ]
+    for name, func in checks:
+        result, _ = measure(name, func, args.repeat)
+        results.append(result)
+    restaurants = list(dataset.index)
+    start, end = monthly_rollup['month'].min(), monthly_rollup['month'].max()
+    result, _ = measure(
+        'comparison ranking (all restaurants, rollups built)',
+        lambda: app.rank_restaurants(monthly_rollup, restaurants, start, end, 'Average rating', 1),
+        args.repeat,
+    )
+    results.append(result)
+    name_index = app.build_name_index(restaurants)
+    result, _ = measure('name search (typo)', lambda: app.search_names(name_index, 'restuarant 1 branc'), args.repeat)
+    results.append(result)
+
+    usage = app.dataset_memory_usage(dataset)
+    summary = {
+        'restaurants': args.restaurants,
+        'reviews_per_restaurant': args.reviews,
+        'description_length': args.description_length,
+        'layout': args.layout,
+        'largest_restaurant_reviews': len(reviews),
+        'frames_mb': usage.sum() / 1e6,
+        's3_mb_read': s3.bytes_read / 1e6,
+        'results': results,
+    }
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--restaurants', type=int, default=100)
+    parser.add_argument('--reviews', type=int, default=1000, help='reviews per restaurant')
+    parser.add_argument('--description-length', type=int, default=200, help='characters per review description')
+    parser.add_argument('--layout', choices=('legacy', 'sharded'), default='legacy', help='layout of the S3 data')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs of each path, the median is reported')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    summary = run(args)
+    print(f"{summary['restaurants']} restaurants x {summary['reviews_per_restaurant']} reviews, "
+          f"{summary['description_length']} characters, {summary['layout']} layout")
+    print(f"Frames: {summary['frames_mb']:.1f} MB, read from S3: {summary['s3_mb_read']:.1f} MB")
+    print(f"{'path':<52}{'median ms':>12}{'peak MB':>10}")
+    for result in summary['results']:
+        print(f"{result['name']:<52}{result['seconds'] * 1000:>12.1f}{result['peak_mb']:>10.1f}")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+
+if __name__ == '__main__':
+    main()